@@ -3,15 +3,35 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
+from flask.cli import AppGroup
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from werkzeug.exceptions import HTTPException
+from sqlalchemy import event, func, literal_column, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import joinedload
 import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from query_budget import QueryBudget
+from search import PrefixIndex, name_filter
+from datetime_filter import DateTimeFilter
+from page_cache import PageCache
+from feeds import TopN
+from bookings import (BookingConflict, ShowSchedule, DEFAULT_DURATION_MINUTES,
+                      exclusion_conflict, free_slots, show_end)
+import bulk
+from request_log import RequestLog, start_queued_logging
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -19,9 +39,32 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+# FYYUR_CONFIG=production for deployments, see config_production.py
+if os.environ.get('FYYUR_CONFIG') == 'production':
+  app.config.from_object('config_production')
 db = SQLAlchemy(app)
+migrate = Migrate(app, db)
 
-# TODO: connect to a local postgresql database
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked to
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+# Most SQL statements a page may issue, whatever the number of shows it lists;
+# enforced in debug and testing mode.
+query_budget = QueryBudget(app, {
+  'show_venue': 4,
+  'show_artist': 4,
+  'index': 3,
+  'edit_venue': 1,
+  'edit_artist': 1,
+})
+
+# Rendered /venues, /artists and /shows pages, tagged with what they list.
+page_cache = PageCache(app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -38,8 +81,22 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    # Denormalized number of shows at this venue that have not started yet,
+    # so /venues never has to count shows. Kept in step by count_new_show(),
+    # count_removed_show() and the roll-forward job (flask fyyur roll-forward).
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every edit; an edit only applies to the version it was made from.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    shows = db.relationship('Show', backref='venue', lazy=True, passive_deletes=True)
+    genre_rows = db.relationship('VenueGenre', lazy=True, cascade='all, delete-orphan')
+    genres = association_proxy('genre_rows', 'genre', creator=lambda genre: VenueGenre(genre=genre))
+
+    # /venues reads every venue in (state, city, name) order straight off this index.
+    __table_args__ = (db.Index('ix_venue_area', 'state', 'city', 'name', 'id'),)
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
@@ -49,25 +106,257 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(120))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    # Bumped by every edit; an edit only applies to the version it was made from.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
+    genre_rows = db.relationship('ArtistGenre', lazy=True, cascade='all, delete-orphan')
+    genres = association_proxy('genre_rows', 'genre', creator=lambda genre: ArtistGenre(genre=genre))
+
+    # /artists?city=&state= filters on this index.
+    __table_args__ = (db.Index('ix_artist_area', 'state', 'city', 'name', 'id'),)
+
+# One row per genre of a venue or an artist. The primary keys serve loading
+# the genres of one venue or artist, the (genre, id) indexes the genre filters.
+class VenueGenre(db.Model):
+    __tablename__ = 'venue_genres'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    genre = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (db.Index('ix_venue_genres_genre', 'genre', 'venue_id'),)
+
+class ArtistGenre(db.Model):
+    __tablename__ = 'artist_genres'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    genre = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (db.Index('ix_artist_genres_genre', 'genre', 'artist_id'),)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Deleting a venue or an artist deletes its shows in the database.
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    # The venue and the artist are booked from start_time for this long. On
+    # PostgreSQL the booking conflicts migration adds exclusion constraints
+    # that keep the shows of a venue, and of an artist, from overlapping.
+    duration_minutes = db.Column(db.Integer, nullable=False, server_default=str(DEFAULT_DURATION_MINUTES))
+
+    # The venue and artist pages read their past and upcoming shows as range
+    # scans of the owner indexes on either side of the current time; /shows
+    # pages through all shows in (start_time, id) order.
+    __table_args__ = (
+      db.Index('ix_show_venue_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_show_artist_start_time', 'artist_id', 'start_time'),
+      db.Index('ix_show_start_time_id', 'start_time', 'id'),
+    )
+
+#----------------------------------------------------------------------------#
+# Past and upcoming shows.
+#----------------------------------------------------------------------------#
+
+PAST_SHOWS_PER_PAGE = 12
+
+def split_shows(owner_column, owner_id, other, past_page=1, now=None):
+  # Upcoming shows and one page of past shows (most recent first) of a venue
+  # or an artist, read as two range scans of the (owner, start_time) index.
+  # The other side of each show (Show.artist or Show.venue) is joined into the
+  # same queries, and the past query carries the size of its whole range as
+  # count() over (), so the past show count needs no query of its own.
+  # Returns (upcoming shows, past shows, past show count).
+  now = now or datetime.now()
+  shows = Show.query.options(
+    joinedload(other).load_only('name', 'image_link')
+  ).filter(owner_column == owner_id)
+  upcoming = shows.filter(Show.start_time > now).order_by(
+    Show.start_time, Show.id).all()
+  past_shows = shows.filter(Show.start_time <= now)
+  past = past_shows.add_columns(func.count().over()).order_by(
+    Show.start_time.desc(), Show.id.desc()).limit(PAST_SHOWS_PER_PAGE).offset(
+    (past_page - 1) * PAST_SHOWS_PER_PAGE).all()
+  if past:
+    past_count = past[0][1]
+  elif past_page > 1:
+    past_count = past_shows.count()
+  else:
+    past_count = 0
+  return upcoming, [show for show, _ in past], past_count
+
+def past_shows_page():
+  page = request.args.get('past_page', 1, type=int)
+  return page if page > 0 else 1
+
+def show_pages(count):
+  return max(1, -(-count // PAST_SHOWS_PER_PAGE))
+
+#----------------------------------------------------------------------------#
+# Autocomplete.
+#----------------------------------------------------------------------------#
+
+SUGGESTIONS_LIMIT = 10
+
+def suggestion_entries():
+  for venue_id, name in db.session.query(Venue.id, Venue.name):
+    yield 'venue', venue_id, name
+  for artist_id, name in db.session.query(Artist.id, Artist.name):
+    yield 'artist', artist_id, name
+
+# Per process; loaded on the first suggestion, updated by the handlers that
+# create, edit or delete venues and artists and rebuilt from the database every
+# SUGGEST_INDEX_MAX_AGE seconds.
+suggest_index = PrefixIndex(suggestion_entries, max_age=app.config['SUGGEST_INDEX_MAX_AGE'])
+
+#----------------------------------------------------------------------------#
+# Upcoming show counts.
+#----------------------------------------------------------------------------#
+
+# Shows that started within this window are recounted by each roll-forward
+# run, so the job must run at least this often (e.g. every 15 minutes).
+ROLL_FORWARD_WINDOW = timedelta(hours=1)
+
+def count_new_show(show, now=None):
+  # call in the transaction that inserts the show
+  if show.start_time > (now or datetime.now()):
+    Venue.query.filter_by(id=show.venue_id).update(
+      {Venue.upcoming_shows_count: Venue.upcoming_shows_count + 1},
+      synchronize_session=False)
+
+def count_removed_show(show, now=None):
+  # call in the transaction that deletes the show
+  if show.start_time > (now or datetime.now()):
+    Venue.query.filter_by(id=show.venue_id).update(
+      {Venue.upcoming_shows_count: Venue.upcoming_shows_count - 1},
+      synchronize_session=False)
+
+def roll_forward_upcoming_counts(now=None, window=ROLL_FORWARD_WINDOW):
+  # Recounts upcoming shows for the venues whose shows started during the
+  # last window (every venue when window is None) with a single UPDATE over
+  # the aggregate, so the run is idempotent and overlapping runs are harmless.
+  # Returns the number of venues updated.
+  now = now or datetime.now()
+  upcoming = db.session.query(func.count(Show.id)).filter(
+    Show.venue_id == Venue.id, Show.start_time > now).as_scalar()
+  venues = Venue.query
+  if window is not None:
+    started = db.session.query(Show.venue_id).filter(
+      Show.start_time > now - window, Show.start_time <= now)
+    venues = venues.filter(Venue.id.in_(started))
+  updated = venues.update({Venue.upcoming_shows_count: upcoming},
+                          synchronize_session=False)
+  db.session.commit()
+  return updated
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+AVAILABILITY_DAYS = 7
+MAX_AVAILABILITY_DAYS = 92
+
+def booked_shows(kind, owner_id):
+  column = Show.venue_id if kind == 'venue' else Show.artist_id
+  rows = db.session.query(Show.id, Show.start_time, Show.duration_minutes).filter(column == owner_id)
+  for show_id, start_time, minutes in rows:
+    yield show_id, start_time, show_end(start_time, minutes)
+
+# Used on SQLite; on PostgreSQL the exclusion constraints check bookings.
+# Per process, loaded one venue or artist at a time.
+show_schedule = ShowSchedule(booked_shows)
+
+def exclusion_constraints():
+  return db.engine.dialect.name == 'postgresql'
+
+def show_period():
+  # the expression the exclusion constraints index, so that && on it is
+  # answered from their GiST index
+  return func.tsrange(
+    Show.start_time, Show.start_time + Show.duration_minutes * literal_column("interval '1 minute'"))
+
+def insert_show(show):
+  # inserts and commits the show, returns its id
+  db.session.add(show)
+  count_new_show(show)
+  db.session.flush()
+  show_id = show.id
+  db.session.commit()
+  return show_id
+
+def venue_booked(venue_id, start, end):
+  # (start, end) of the venue's shows overlapping [start, end)
+  if exclusion_constraints():
+    rows = db.session.query(Show.start_time, Show.duration_minutes).filter(
+      Show.venue_id == venue_id, show_period().op('&&')(func.tsrange(start, end)))
+    return [(start_time, show_end(start_time, minutes)) for start_time, minutes in rows]
+  return show_schedule.booked('venue', venue_id, start, end)
+
+#----------------------------------------------------------------------------#
+# Home feeds.
+#----------------------------------------------------------------------------#
+
+HOME_FEED_SIZE = 10
+
+def feed_item(row):
+  return {
+    "id": row.id,
+    "name": row.name,
+    "image_link": row.image_link,
+  }
+
+def trending_item(row):
+  item = feed_item(row)
+  item["num_upcoming_shows"] = row.upcoming_shows_count
+  return item
+
+def recently_listed(model):
+  # newest first; ids are handed out in listing order
+  def load(limit):
+    rows = db.session.query(model.id, model.name, model.image_link).order_by(model.id.desc()).limit(limit)
+    return [(row.id, row.id, feed_item(row)) for row in rows]
+  return load
+
+def most_upcoming_shows(limit):
+  rows = db.session.query(Venue.id, Venue.name, Venue.image_link, Venue.upcoming_shows_count).filter(
+    Venue.upcoming_shows_count > 0
+  ).order_by(Venue.upcoming_shows_count.desc(), Venue.id.desc()).limit(limit)
+  return [(row.id, row.upcoming_shows_count, trending_item(row)) for row in rows]
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+# Per process, kept up to date by the handlers below and reloaded from the
+# database every HOME_FEED_MAX_AGE seconds.
+recent_venues = TopN(recently_listed(Venue), HOME_FEED_SIZE, max_age=app.config['HOME_FEED_MAX_AGE'])
+recent_artists = TopN(recently_listed(Artist), HOME_FEED_SIZE, max_age=app.config['HOME_FEED_MAX_AGE'])
+trending_venues = TopN(most_upcoming_shows, HOME_FEED_SIZE, max_age=app.config['HOME_FEED_MAX_AGE'])
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def rescore_venue(venue_id):
+  # call after committing a change to the venue's upcoming show count
+  row = db.session.query(Venue.id, Venue.name, Venue.image_link, Venue.upcoming_shows_count).filter(
+    Venue.id == venue_id).first()
+  if row is None or row.upcoming_shows_count <= 0:
+    trending_venues.discard(venue_id)
+  else:
+    trending_venues.offer(row.id, row.upcoming_shows_count, trending_item(row))
+
+def render_home():
+  return render_template('pages/home.html',
+    recent_venues=recent_venues.items(),
+    recent_artists=recent_artists.items(),
+    trending_venues=trending_venues.items())
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# {{ show.start_time|datetime('full') }}
+format_datetime = DateTimeFilter(locale='en')
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -75,140 +364,125 @@ app.jinja_env.filters['datetime'] = format_datetime
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def flash_errors(form):
+  # Shown above the form when a submission is rendered again.
+  for name, errors in form.errors.items():
+    for error in errors:
+      flash('{}: {}'.format(getattr(form, name).label.text, error))
+
 @app.route('/')
 def index():
-  return render_template('pages/home.html')
+  return render_home()
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
+  # one ordered read of the venue index; the counts are denormalized on Venue.
+  # ?genre=, ?city= and ?state= narrow the listing through the genre and area indexes.
+  rows = db.session.query(
+    Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count
+  ).order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+  genre = request.args.get('genre')
+  if genre:
+    rows = rows.join(VenueGenre, VenueGenre.venue_id == Venue.id).filter(VenueGenre.genre == genre)
+  if request.args.get('city'):
+    rows = rows.filter(Venue.city == request.args['city'])
+  if request.args.get('state'):
+    rows = rows.filter(Venue.state == request.args['state'])
+  data = []
+  for (city, state), area in groupby(rows, key=lambda row: (row.city, row.state)):
+    data.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.upcoming_shows_count,
+      } for row in area]
+    })
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for Hop should return "The Musical Hop".
-  # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
+  # case-insensitive partial match on the name, served by the name search index;
+  # the upcoming show counts come from the same rows
+  search_term = request.form.get('search_term', '')
+  rows = db.session.query(Venue.id, Venue.name, Venue.upcoming_shows_count).filter(
+    name_filter(db, Venue, search_term)).order_by(Venue.name, Venue.id).all()
   response={
-    "count": 1,
+    "count": len(rows),
     "data": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.upcoming_shows_count,
+    } for row in rows]
   }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
+  venue = Venue.query.options(joinedload(Venue.genre_rows)).get(venue_id)
+  if venue is None:
+    abort(404)
+  past_page = past_shows_page()
+  upcoming, past, past_count = split_shows(Show.venue_id, venue_id, Show.artist, past_page)
+
+  def show_data(show):
+    return {
+      "artist_id": show.artist_id,
+      "artist_name": show.artist.name,
+      "artist_image_link": show.artist.image_link,
+      "start_time": show.start_time
+    }
+
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": list(venue.genres),
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "past_shows": [show_data(show) for show in past],
+    "upcoming_shows": [show_data(show) for show in upcoming],
+    "past_shows_count": past_count,
+    "upcoming_shows_count": len(upcoming),
+    "past_page": past_page,
+    "past_pages": show_pages(past_count),
   }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  # booked and free slots of a venue from ?from= (default now) to ?to= (default
+  # a week later)
+  start = datetime_arg('from') or datetime.now().replace(second=0, microsecond=0)
+  end = datetime_arg('to') or start + timedelta(days=AVAILABILITY_DAYS)
+  if end <= start or end - start > timedelta(days=MAX_AVAILABILITY_DAYS):
+    abort(400)
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+    abort(404)
+  booked = sorted(venue_booked(venue_id, start, end))
+  return jsonify({
+    "venue_id": venue_id,
+    "from": start.isoformat(),
+    "to": end.isoformat(),
+    "booked": [{"start": slot_start.isoformat(), "end": slot_end.isoformat()}
+               for slot_start, slot_end in booked],
+    "free": [{"start": slot_start.isoformat(), "end": slot_end.isoformat()}
+             for slot_start, slot_end in free_slots(booked, start, end)],
+  })
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -219,187 +493,356 @@ def create_venue_form():
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+  form = VenueForm()
+  if not form.validate_on_submit():
+    flash_errors(form)
+    return render_template('forms/new_venue.html', form=form), 400
+  venue = Venue(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    address=form.address.data,
+    phone=form.phone.data,
+    genres=form.genres.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    website=form.website_link.data,
+    seeking_talent=form.seeking_talent.data,
+    seeking_description=form.seeking_description.data,
+  )
+  try:
+    db.session.add(venue)
+    db.session.commit()
+    suggest_index.add('venue', venue.id, venue.name)
+    recent_venues.offer(venue.id, venue.id, feed_item(venue))
+    page_cache.invalidate('venues')
+    flash('Venue ' + venue.name + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not insert venue')
+    flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')
+  finally:
+    db.session.close()
+  return render_home()
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  # One DELETE; the venue's shows and genres go with it through ON DELETE CASCADE,
+  # without being loaded. The venue row is locked first so that the show count
+  # cannot change under us.
+  try:
+    locked = db.session.query(Venue.id).filter(Venue.id == venue_id).with_for_update().first()
+    if locked is None:
+      abort(404)
+    deleted_shows = db.session.query(func.count(Show.id)).filter(Show.venue_id == venue_id).scalar()
+    Venue.query.filter(Venue.id == venue_id).delete(synchronize_session=False)
+    db.session.commit()
+  except HTTPException:
+    db.session.rollback()
+    raise
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not delete venue')
+    abort(500)
+  finally:
+    db.session.close()
+  suggest_index.remove('venue', venue_id)
+  recent_venues.discard(venue_id)
+  trending_venues.discard(venue_id)
+  show_schedule.invalidate()
+  page_cache.invalidate('venues', 'shows')
+  return jsonify({
+    "success": True,
+    "deleted": venue_id,
+    "deleted_shows": deleted_shows,
+  })
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached('artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
+  # ?genre=, ?city= and ?state= narrow the listing through the genre and area indexes
+  rows = db.session.query(Artist.id, Artist.name).order_by(Artist.name, Artist.id)
+  genre = request.args.get('genre')
+  if genre:
+    rows = rows.join(ArtistGenre, ArtistGenre.artist_id == Artist.id).filter(ArtistGenre.genre == genre)
+  if request.args.get('city'):
+    rows = rows.filter(Artist.city == request.args['city'])
+  if request.args.get('state'):
+    rows = rows.filter(Artist.state == request.args['state'])
+  data = [{
+    "id": row.id,
+    "name": row.name,
+  } for row in rows]
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
+  # case-insensitive partial match on the name, served by the name search index;
+  # the upcoming show counts are a correlated count over the
+  # (artist_id, start_time) index in the same statement
+  search_term = request.form.get('search_term', '')
+  upcoming = db.session.query(func.count(Show.id)).filter(
+    Show.artist_id == Artist.id, Show.start_time > datetime.now()
+  ).correlate(Artist).as_scalar()
+  rows = db.session.query(Artist.id, Artist.name, upcoming.label('num_upcoming_shows')).filter(
+    name_filter(db, Artist, search_term)).order_by(Artist.name, Artist.id).all()
   response={
-    "count": 1,
+    "count": len(rows),
     "data": [{
-      "id": 4,
-      "name": "Guns N Petals",
-      "num_upcoming_shows": 0,
-    }]
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows,
+    } for row in rows]
   }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/search/suggest')
+def search_suggest():
+  limit = min(request.args.get('limit', SUGGESTIONS_LIMIT, type=int), 50)
+  suggestions = suggest_index.suggest(request.args.get('q', ''), max(limit, 0))
+  return jsonify({
+    "suggestions": [{
+      "type": kind,
+      "id": entry_id,
+      "name": name,
+    } for kind, entry_id, name in suggestions]
+  })
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  # TODO: replace with real artist data from the artist table, using artist_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
+  artist = Artist.query.options(joinedload(Artist.genre_rows)).get(artist_id)
+  if artist is None:
+    abort(404)
+  past_page = past_shows_page()
+  upcoming, past, past_count = split_shows(Show.artist_id, artist_id, Show.venue, past_page)
+
+  def show_data(show):
+    return {
+      "venue_id": show.venue_id,
+      "venue_name": show.venue.name,
+      "venue_image_link": show.venue.image_link,
+      "start_time": show.start_time
+    }
+
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": list(artist.genres),
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "past_shows": [show_data(show) for show in past],
+    "upcoming_shows": [show_data(show) for show in upcoming],
+    "past_shows_count": past_count,
+    "upcoming_shows_count": len(upcoming),
+    "past_page": past_page,
+    "past_pages": show_pages(past_count),
   }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  # One DELETE, cascading to the artist's shows and genres. The upcoming show
+  # counters of the venues those shows were at are decremented in the same
+  # transaction, with one UPDATE over the per-venue counts.
+  now = datetime.now()
+  try:
+    locked = db.session.query(Artist.id).filter(Artist.id == artist_id).with_for_update().first()
+    if locked is None:
+      abort(404)
+    deleted_shows = db.session.query(func.count(Show.id)).filter(Show.artist_id == artist_id).scalar()
+    upcoming = Show.query.filter(Show.artist_id == artist_id, Show.start_time > now)
+    upcoming_at_venue = db.session.query(func.count(Show.id)).filter(
+      Show.artist_id == artist_id, Show.start_time > now, Show.venue_id == Venue.id
+    ).as_scalar()
+    Venue.query.filter(Venue.id.in_(upcoming.with_entities(Show.venue_id))).update(
+      {Venue.upcoming_shows_count: Venue.upcoming_shows_count - upcoming_at_venue},
+      synchronize_session=False)
+    Artist.query.filter(Artist.id == artist_id).delete(synchronize_session=False)
+    db.session.commit()
+  except HTTPException:
+    db.session.rollback()
+    raise
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not delete artist')
+    abort(500)
+  finally:
+    db.session.close()
+  suggest_index.remove('artist', artist_id)
+  recent_artists.discard(artist_id)
+  # the upcoming show counts of every venue the artist played at changed
+  trending_venues.invalidate()
+  show_schedule.invalidate()
+  page_cache.invalidate('artists', 'venues', 'shows')
+  return jsonify({
+    "success": True,
+    "deleted": artist_id,
+    "deleted_shows": deleted_shows,
+  })
+
 #  Update
 #  ----------------------------------------------------------------
+# Form field -> column, for the details the edit forms change besides genres.
+VENUE_FIELDS = {
+  'name': Venue.name,
+  'city': Venue.city,
+  'state': Venue.state,
+  'address': Venue.address,
+  'phone': Venue.phone,
+  'image_link': Venue.image_link,
+  'facebook_link': Venue.facebook_link,
+  'website_link': Venue.website,
+  'seeking_talent': Venue.seeking_talent,
+  'seeking_description': Venue.seeking_description,
+}
+ARTIST_FIELDS = {
+  'name': Artist.name,
+  'city': Artist.city,
+  'state': Artist.state,
+  'phone': Artist.phone,
+  'image_link': Artist.image_link,
+  'facebook_link': Artist.facebook_link,
+  'website_link': Artist.website,
+  'seeking_venue': Artist.seeking_venue,
+  'seeking_description': Artist.seeking_description,
+}
+
+def edit_values(model, genre_column, fields, owner_id):
+  # The form data and version of a venue or an artist from one query over the
+  # listed columns, outer joined to its genres (one result row per genre).
+  # Returns (data, version), or None when there is no such row.
+  rows = db.session.query(model.version, genre_column.class_.genre, *fields.values()).outerjoin(
+    genre_column.class_, genre_column == model.id).filter(model.id == owner_id).all()
+  if not rows:
+    return None
+  data = dict(zip(fields, rows[0][2:]))
+  data['genres'] = [row[1] for row in rows if row[1] is not None]
+  return data, rows[0][0]
+
+def update_details(model, genre_column, fields, owner_id, version, form):
+  # One UPDATE ... WHERE id = :id AND version = :version that also bumps the
+  # version, then the genres are replaced. Returns False, changing nothing,
+  # when the row was edited or deleted since the form was rendered.
+  values = {column.key: getattr(form, field).data for field, column in fields.items()}
+  values['version'] = model.version + 1
+  updated = model.query.filter(model.id == owner_id, model.version == version).update(
+    values, synchronize_session=False)
+  if not updated:
+    return False
+  genre_model = genre_column.class_
+  genre_model.query.filter(genre_column == owner_id).delete(synchronize_session=False)
+  genres = sorted(set(form.genres.data or ()))
+  if genres:
+    db.session.execute(genre_model.__table__.insert(),
+                       [{genre_column.key: owner_id, 'genre': genre} for genre in genres])
+  return True
+
+def render_edit_artist(artist_id, status=200):
+  found = edit_values(Artist, ArtistGenre.artist_id, ARTIST_FIELDS, artist_id)
+  if found is None:
+    abort(404)
+  data, version = found
+  form = ArtistForm(formdata=None, data=data)
+  artist = {"id": artist_id, "name": data['name'], "version": version}
+  return render_template('forms/edit_artist.html', form=form, artist=artist), status
+
+def render_edit_venue(venue_id, status=200):
+  found = edit_values(Venue, VenueGenre.venue_id, VENUE_FIELDS, venue_id)
+  if found is None:
+    abort(404)
+  data, version = found
+  form = VenueForm(formdata=None, data=data)
+  venue = {"id": venue_id, "name": data['name'], "version": version}
+  return render_template('forms/edit_venue.html', form=form, venue=venue), status
+
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
-  }
-  # TODO: populate form with fields from artist with ID <artist_id>
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
+  return render_edit_artist(artist_id)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
+  # Edits made from an outdated form (someone else saved the artist in the
+  # meantime) are not applied; the form is shown again with the current
+  # details and a 409. An invalid form is shown again as submitted, with a 400.
+  form = ArtistForm()
+  version = request.form.get('version', type=int)
+  if version is None:
+    abort(400)
+  if not form.validate_on_submit():
+    flash_errors(form)
+    artist = {"id": artist_id, "name": form.name.data, "version": version}
+    return render_template('forms/edit_artist.html', form=form, artist=artist), 400
+  try:
+    updated = update_details(Artist, ArtistGenre.artist_id, ARTIST_FIELDS, artist_id, version, form)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not update artist')
+    flash('An error occurred. Artist ' + form.name.data + ' could not be updated.')
+    return redirect(url_for('show_artist', artist_id=artist_id))
+  finally:
+    db.session.close()
+  if not updated:
+    flash('This artist was changed by someone else while you were editing it, '
+          'so your changes were not saved. These are the current details.')
+    return render_edit_artist(artist_id, 409)
+  suggest_index.update('artist', artist_id, form.name.data)
+  recent_artists.offer(artist_id, artist_id, {
+    "id": artist_id,
+    "name": form.name.data,
+    "image_link": form.image_link.data,
+  })
+  page_cache.invalidate('artists', 'shows')
+  flash('Artist ' + form.name.data + ' was successfully updated!')
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-  }
-  # TODO: populate form with values from venue with ID <venue_id>
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
+  return render_edit_venue(venue_id)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  # same as edit_artist_submission()
+  form = VenueForm()
+  version = request.form.get('version', type=int)
+  if version is None:
+    abort(400)
+  if not form.validate_on_submit():
+    flash_errors(form)
+    venue = {"id": venue_id, "name": form.name.data, "version": version}
+    return render_template('forms/edit_venue.html', form=form, venue=venue), 400
+  try:
+    updated = update_details(Venue, VenueGenre.venue_id, VENUE_FIELDS, venue_id, version, form)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not update venue')
+    flash('An error occurred. Venue ' + form.name.data + ' could not be updated.')
+    return redirect(url_for('show_venue', venue_id=venue_id))
+  finally:
+    db.session.close()
+  if not updated:
+    flash('This venue was changed by someone else while you were editing it, '
+          'so your changes were not saved. These are the current details.')
+    return render_edit_venue(venue_id, 409)
+  suggest_index.update('venue', venue_id, form.name.data)
+  recent_venues.offer(venue_id, venue_id, {
+    "id": venue_id,
+    "name": form.name.data,
+    "image_link": form.image_link.data,
+  })
+  rescore_venue(venue_id)
+  page_cache.invalidate('venues', 'shows')
+  flash('Venue ' + form.name.data + ' was successfully updated!')
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -413,61 +856,119 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
-  return render_template('pages/home.html')
+  form = ArtistForm()
+  if not form.validate_on_submit():
+    flash_errors(form)
+    return render_template('forms/new_artist.html', form=form), 400
+  artist = Artist(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    phone=form.phone.data,
+    genres=form.genres.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    website=form.website_link.data,
+    seeking_venue=form.seeking_venue.data,
+    seeking_description=form.seeking_description.data,
+  )
+  try:
+    db.session.add(artist)
+    db.session.commit()
+    suggest_index.add('artist', artist.id, artist.name)
+    recent_artists.offer(artist.id, artist.id, feed_item(artist))
+    page_cache.invalidate('artists')
+    flash('Artist ' + artist.name + ' was successfully listed!')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not insert artist')
+    flash('An error occurred. Artist ' + form.name.data + ' could not be listed.')
+  finally:
+    db.session.close()
+  return render_home()
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
+SHOWS_PER_PAGE = 60
+SHOWS_STREAM_BATCH_SIZE = 1000
+
+def datetime_arg(name):
+  value = request.args.get(name)
+  if not value:
+    return None
+  try:
+    return datetime.fromisoformat(value)
+  except ValueError:
+    abort(400)
+
+def show_listing():
+  # Shows matching the /shows filters, in (start_time, id) order (newest first
+  # for ?when=past), starting after the ?after_time=&after_id= keyset cursor.
+  # Returns (query, descending).
+  query = db.session.query(
+    Show.id, Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link, Show.start_time
+  ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+  when = request.args.get('when')
+  if when == 'upcoming':
+    query = query.filter(Show.start_time > datetime.now())
+  elif when == 'past':
+    query = query.filter(Show.start_time <= datetime.now())
+  elif when is not None:
+    abort(400)
+  start, end = datetime_arg('from'), datetime_arg('to')
+  if start is not None:
+    query = query.filter(Show.start_time >= start)
+  if end is not None:
+    query = query.filter(Show.start_time < end)
+  descending = when == 'past'
+  after_time = datetime_arg('after_time')
+  after_id = request.args.get('after_id', type=int)
+  if after_time is not None and after_id is not None:
+    key = tuple_(Show.start_time, Show.id)
+    query = query.filter(key < (after_time, after_id) if descending else key > (after_time, after_id))
+  if descending:
+    query = query.order_by(Show.start_time.desc(), Show.id.desc())
+  else:
+    query = query.order_by(Show.start_time, Show.id)
+  return query, descending
+
+def show_listing_data(row):
+  return {
+    "venue_id": row[1],
+    "venue_name": row[2],
+    "artist_id": row[3],
+    "artist_name": row[4],
+    "artist_image_link": row[5],
+    "start_time": row[6]
+  }
+
+def stream_template(template_name, **context):
+  app.update_template_context(context)
+  stream = app.jinja_env.get_template(template_name).stream(context)
+  stream.enable_buffering(100)
+  return stream
+
 @app.route('/shows')
+@page_cache.cached('shows')
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
-  return render_template('pages/shows.html', shows=data)
+  # displays list of shows at /shows, one page at a time; ?stream=true renders
+  # every matching show, reading them from a server-side cursor and sending the
+  # page as it is rendered.
+  query, descending = show_listing()
+  if request.args.get('stream') == 'true':
+    rows = (show_listing_data(row) for row in query.yield_per(SHOWS_STREAM_BATCH_SIZE))
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=rows)))
+  rows = query.limit(SHOWS_PER_PAGE + 1).all()
+  next_page = None
+  if len(rows) > SHOWS_PER_PAGE:
+    rows = rows[:SHOWS_PER_PAGE]
+    args = request.args.to_dict()
+    args.update(after_time=rows[-1][6].isoformat(), after_id=rows[-1][0])
+    next_page = url_for('shows', **args)
+  data = [show_listing_data(row) for row in rows]
+  return render_template('pages/shows.html', shows=data, next_page=next_page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -478,14 +979,65 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  # Double bookings of the venue or the artist are rejected atomically with the
+  # insert: by the exclusion constraints on PostgreSQL, by checking and
+  # committing under the show schedule's lock elsewhere.
+  form = ShowForm()
+  if not form.validate_on_submit():
+    flash_errors(form)
+    return render_template('forms/new_show.html', form=form), 400
+  try:
+    duration = form.duration.data or DEFAULT_DURATION_MINUTES
+    venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+    start = form.start_time.data
+    show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start, duration_minutes=duration)
+    if exclusion_constraints():
+      insert_show(show)
+    else:
+      end = show_end(start, duration)
+      with show_schedule.lock:
+        show_schedule.check(venue_id, artist_id, start, end)
+        show_id = insert_show(show)
+        show_schedule.add(show_id, venue_id, artist_id, start, end)
+    rescore_venue(venue_id)
+    page_cache.invalidate('shows', 'venues')
+    flash('Show was successfully listed!')
+  except Exception as e:
+    db.session.rollback()
+    conflict = e if isinstance(e, BookingConflict) else exclusion_conflict(e)
+    if conflict is not None:
+      flash('Show could not be listed: the ' + conflict.kind + ' is already booked at that time.')
+    else:
+      app.logger.exception('could not insert show')
+      flash('An error occurred. Show could not be listed.')
+  finally:
+    db.session.close()
+  return render_home()
+
+@app.route('/shows/<int:show_id>', methods=['DELETE'])
+def delete_show(show_id):
+  show = Show.query.get(show_id)
+  if show is None:
+    abort(404)
+  booking = (show_id, show.venue_id, show.artist_id, show.start_time)
+  try:
+    count_removed_show(show)
+    db.session.delete(show)
+    db.session.commit()
+    show_schedule.remove(*booking)
+    rescore_venue(booking[1])
+    page_cache.invalidate('shows', 'venues')
+  except Exception:
+    db.session.rollback()
+    app.logger.exception('could not delete show')
+    abort(500)
+  finally:
+    db.session.close()
+  return '', 204
 
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(page_cache.stats())
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -496,16 +1048,74 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+# One JSON record per request on the fyyur.requests logger.
+request_log = RequestLog(app, slow_ms=app.config['SLOW_REQUEST_MS'])
+
+queued_logging = None
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    queued_logging = start_queued_logging(
+        [app.logger, request_log.logger], app.config['LOG_FILE'],
+        app.config['LOG_MAX_BYTES'], app.config['LOG_BACKUP_COUNT'])
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+fyyur_cli = AppGroup('fyyur', help='Maintenance commands for Fyyur.')
+
+@fyyur_cli.command('roll-forward')
+@click.option('--full', is_flag=True,
+              help='Recount every venue instead of only those with recently started shows.')
+def roll_forward_command(full):
+  '''Move shows that have started out of the upcoming show counts.'''
+  updated = roll_forward_upcoming_counts(window=None if full else ROLL_FORWARD_WINDOW)
+  click.echo('recounted upcoming shows for {} venues'.format(updated))
+
+@fyyur_cli.command('import')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False))
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False))
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(bulk.FORMATS))
+@click.option('--batch-size', default=bulk.DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--copy/--no-copy', 'use_copy', default=None,
+              help='Use COPY (default on PostgreSQL).')
+@click.option('--skip-invalid', is_flag=True,
+              help='Skip invalid records instead of stopping.')
+@click.option('--checkpoint', default=bulk.DEFAULT_CHECKPOINT, show_default=True,
+              type=click.Path(dir_okay=False),
+              help='Progress file a failed import resumes from.')
+def import_command(venues, artists, shows, file_format, batch_size, use_copy,
+                   skip_invalid, checkpoint):
+  '''Import venues, artists and shows from CSV or JSON Lines files.'''
+  files = {kind: path for kind, path in
+           (('venues', venues), ('artists', artists), ('shows', shows)) if path}
+  if not files:
+    raise click.UsageError('pass at least one of --venues, --artists, --shows')
+  formats = {kind: bulk.detect_format(path, file_format) for kind, path in files.items()}
+  importer = bulk.CatalogImporter(db, batch_size=batch_size, use_copy=use_copy,
+                                  skip_invalid=skip_invalid, checkpoint=checkpoint)
+  done = importer.resume(files)
+  if done:
+    click.echo('resuming after {} records from {}'.format(done, checkpoint))
+  started = time.perf_counter()
+  try:
+    imported_shows = bulk.import_files(importer, files, formats)
+  except ValueError as e:
+    raise click.ClickException('{} (rerun the same command to resume)'.format(e))
+  except IntegrityError as e:
+    conflict = exclusion_conflict(e)
+    if conflict is None:
+      raise
+    raise click.ClickException('{}: {} (fix the file and rerun the same command to resume)'.format(
+      conflict, e.orig))
+  if imported_shows:
+    roll_forward_upcoming_counts(window=None)
+  importer.finish()
+  click.echo('import finished in {:.2f}s'.format(time.perf_counter() - started))
+
+app.cli.add_command(fyyur_cli)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,100 @@
+'''
+Render time of /shows with the original and the current datetime filter.
+
+    cd starter_code
+    python -m benchmarks.bench_datetime_filter [--shows 10000] [--distinct]
+
+Renders pages/shows.html with generated show rows. "before" is the
+original format_datetime filter fed ISO strings (dateutil parse and
+babel.dates.format_datetime per row), "after" the DateTimeFilter fed
+datetime objects. Start times repeat the way real listings do (a few
+slots per evening) unless --distinct gives every show its own time.
+No database is needed.
+'''
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+
+from app import app
+from datetime_filter import DateTimeFilter
+
+SECONDS = 3.0
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def generate_shows(count, distinct):
+    rng = random.Random(0)
+    first = datetime(2019, 1, 1, 19, 0)
+    shows = []
+    for i in range(count):
+        if distinct:
+            start_time = first + timedelta(minutes=i)
+        else:
+            start_time = first + timedelta(days=rng.randrange(730),
+                                           hours=rng.choice((0, 1, 2)))
+        shows.append({
+            'venue_id': rng.randrange(1, 500),
+            'venue_name': 'Venue {}'.format(i % 500),
+            'artist_id': rng.randrange(1, 2000),
+            'artist_name': 'Artist {}'.format(i % 2000),
+            'artist_image_link': 'https://example.com/{}.jpg'.format(i),
+            'start_time': start_time,
+        })
+    return shows
+
+
+def renders_per_second(shows):
+    count = 0
+    started = time.perf_counter()
+    with app.test_request_context('/shows'):
+        while time.perf_counter() - started < SECONDS:
+            render_template('pages/shows.html', shows=shows)
+            count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--distinct', action='store_true')
+    args = parser.parse_args()
+
+    shows = generate_shows(args.shows, args.distinct)
+    legacy_shows = [dict(show, start_time=show['start_time'].isoformat())
+                    for show in shows]
+
+    app.jinja_env.filters['datetime'] = legacy_format_datetime
+    before = renders_per_second(legacy_shows)
+    app.jinja_env.filters['datetime'] = DateTimeFilter(locale='en')
+    after = renders_per_second(shows)
+
+    print('{} shows, {} distinct start times'.format(
+        len(shows), len({show['start_time'] for show in shows})))
+    print('{:<16} {:>10} {:>10} {:>8}'.format(
+        'page', 'before', 'after', 'speedup'))
+    print('{:<16} {:>8.2f}/s {:>8.2f}/s {:>7.1f}x'.format(
+        '/shows', before, after, after / before))
+
+    start_times = [show['start_time'] for show in shows]
+    cold = DateTimeFilter(locale='en')
+    started = time.perf_counter()
+    cold.format_many(start_times, 'full')
+    print('format_many of {} start times (cold): {:.1f} ms'.format(
+        len(start_times), (time.perf_counter() - started) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+'''
+Booking conflicts between shows.
+
+A show books its venue and its artist from start_time for
+duration_minutes. Two shows of the same venue, or of the same artist,
+may not overlap:
+
+    PostgreSQL: exclusion constraints over tsrange(start, end), created
+                by the booking conflicts migration, checked by the GiST
+                index as part of the INSERT.
+    SQLite:     ShowSchedule, an in-memory interval index per venue and
+                per artist; create_show_submission() checks it and
+                commits the show while holding its lock.
+
+The ShowSchedule is per process, so the SQLite fallback is only
+authoritative for a single process serving the app (the development
+server); deployments run on PostgreSQL.
+
+free_slots() turns the booked intervals of a venue into the free ones
+for GET /venues/<id>/availability.
+'''
+
+DEFAULT_DURATION_MINUTES = 120
+MAX_DURATION_MINUTES = 24 * 60
+# names of the exclusion constraints -> what the show conflicts with
+EXCLUSION_CONSTRAINTS = {
+    'show_venue_no_overlap': 'venue',
+    'show_artist_no_overlap': 'artist',
+}
+EXCLUSION_VIOLATION = '23P01'
+
+
+class BookingConflict(Exception):
+
+    def __init__(self, kind, show_id=None):
+        super(BookingConflict, self).__init__(
+            'the {} is already booked at that time'.format(kind))
+        self.kind = kind
+        self.show_id = show_id
+
+
+def show_end(start_time, duration_minutes):
+    return start_time + timedelta(minutes=duration_minutes)
+
+
+def exclusion_conflict(error):
+    '''
+    The BookingConflict behind an IntegrityError raised by one of the
+    exclusion constraints on PostgreSQL, or None.
+    '''
+    orig = getattr(error, 'orig', None)
+    if getattr(orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+        return None
+    constraint = getattr(getattr(orig, 'diag', None), 'constraint_name', None)
+    return BookingConflict(EXCLUSION_CONSTRAINTS.get(constraint, 'venue or artist'))
+
+
+class OwnerSchedule(object):
+    '''
+    The shows of one venue or artist as (start, end, show id) entries
+    in one sorted list. Every show overlapping [start, end) starts
+    in [start - longest show, end), so a lookup is a bisect to that
+    window; once overlaps are rejected the window holds at most one
+    show before the one being checked.
+    '''
+
+    def __init__(self, entries=()):
+        self.entries = sorted(entries)
+        self.longest = max((end - start for start, end, _ in self.entries),
+                           default=timedelta(0))
+
+    def overlapping(self, start, end):
+        i = bisect_left(self.entries, (start - self.longest,))
+        stop = bisect_left(self.entries, (end,))
+        return [entry for entry in self.entries[i:stop] if entry[1] > start]
+
+    def add(self, show_id, start, end):
+        insort(self.entries, (start, end, show_id))
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, show_id, start):
+        i = bisect_left(self.entries, (start,))
+        while i < len(self.entries) and self.entries[i][0] == start:
+            if self.entries[i][2] == show_id:
+                del self.entries[i]
+                return
+            i += 1
+
+
+class ShowSchedule(object):
+    '''
+    Per-process index of the intervals booked for each venue and each
+    artist. The shows of an owner are read with loader(kind, owner_id),
+    which returns (show id, start, end) rows, the first time the owner
+    is looked up.
+
+    Hold the lock from the conflict check through the commit of the
+    show and its add(), so that two requests cannot book the same slot.
+    '''
+
+    def __init__(self, loader):
+        self._loader = loader
+        self.lock = threading.RLock()
+        self._owners = {}
+
+    def _owner(self, kind, owner_id):
+        key = (kind, owner_id)
+        schedule = self._owners.get(key)
+        if schedule is None:
+            schedule = OwnerSchedule(
+                (start, end, show_id)
+                for show_id, start, end in self._loader(kind, owner_id))
+            self._owners[key] = schedule
+        return schedule
+
+    def booked(self, kind, owner_id, start, end):
+        with self.lock:
+            return [(entry[0], entry[1]) for entry in
+                    self._owner(kind, owner_id).overlapping(start, end)]
+
+    def check(self, venue_id, artist_id, start, end):
+        '''
+        Raises BookingConflict if the venue or the artist already has
+        a show overlapping [start, end).
+        '''
+        with self.lock:
+            for kind, owner_id in (('venue', venue_id), ('artist', artist_id)):
+                overlapping = self._owner(kind, owner_id).overlapping(start, end)
+                if overlapping:
+                    raise BookingConflict(kind, overlapping[0][2])
+
+    def add(self, show_id, venue_id, artist_id, start, end):
+        with self.lock:
+            for kind, owner_id in (('venue', venue_id), ('artist', artist_id)):
+                if (kind, owner_id) in self._owners:
+                    self._owners[kind, owner_id].add(show_id, start, end)
+
+    def remove(self, show_id, venue_id, artist_id, start):
+        with self.lock:
+            for kind, owner_id in (('venue', venue_id), ('artist', artist_id)):
+                if (kind, owner_id) in self._owners:
+                    self._owners[kind, owner_id].remove(show_id, start)
+
+    def invalidate(self):
+        # owners are reloaded on their next lookup
+        with self.lock:
+            self._owners.clear()
+
+
+def free_slots(booked, start, end):
+    '''
+    The gaps between the booked (start, end) intervals within
+    [start, end), as a sorted list of (start, end).
+    '''
+    slots = []
+    cursor = start
+    for busy_start, busy_end in sorted(booked):
+        if busy_start > cursor:
+            slots.append((cursor, min(busy_start, end)))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        slots.append((cursor, end))
+    return slots
@@ -0,0 +1,396 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import text
+from wtforms import (BooleanField, DateTimeField, IntegerField, SelectField,
+                     SelectMultipleField)
+from wtforms.fields.core import UnboundField
+from wtforms.validators import StopValidation, ValidationError
+
+from bookings import DEFAULT_DURATION_MINUTES
+from forms import ArtistForm, ShowForm, VenueForm
+
+'''
+Bulk import of the venue, artist and show catalogue.
+
+    flask fyyur import --venues venues.csv --artists artists.jsonl \
+        --shows shows.csv [--batch-size 5000]
+
+Files are streamed one record at a time in CSV or JSON Lines format
+(picked from the file extension or --format) and use the field names
+of the forms in forms.py, plus an "id" on venues and artists that
+shows refer to with venue_id and artist_id. Records are validated with
+the rules of those forms, read once from the form classes, and
+inserted in batches: COPY on PostgreSQL, executemany everywhere else.
+
+Database ids for venues and artists are allocated per batch, so show
+references are resolved from an in-memory map of file id -> database
+id. After every committed batch the importer writes a checkpoint with
+the number of records done per file and the id maps; rerunning the
+same command after a failure resumes from it.
+
+Overlapping shows are rejected by the exclusion constraints on
+PostgreSQL, failing their batch; SQLite does not check imported shows
+(see bookings.py).
+
+detect_format(), read_records(), LineCountingReader and copy_rows()
+are the file handling of the trivia API's flaskr/bulk.py. The two apps
+are deployed separately and share no package, so each keeps its own
+copy; a fix to one belongs in both.
+'''
+
+FORMATS = ('jsonl', 'csv')
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CHECKPOINT = 'fyyur-import.checkpoint'
+# import order: shows refer to venues and artists
+KINDS = ('venues', 'artists', 'shows')
+TRUE_VALUES = ('1', 'y', 'yes', 'true', 'on')
+
+
+class _Field(object):
+    '''
+    The part of a bound WTForms field that validators use, so they can
+    check plain values without building a form per record.
+    '''
+
+    def __init__(self):
+        self.data = None
+        # the submitted value, which Optional() checks for emptiness
+        self.raw_data = []
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+    def ngettext(self, singular, plural, n):
+        return singular if n == 1 else plural
+
+
+class FormRules(object):
+    '''
+    Validation rules of a form class: its validators, choices and
+    field types, read once from the field declarations.
+    '''
+
+    def __init__(self, form_class):
+        self.fields = sorted(
+            ((name, field) for name, field in vars(form_class).items()
+             if isinstance(field, UnboundField)),
+            key=lambda item: item[1].creation_counter)
+        self._field = _Field()
+
+    def _coerce(self, field, value):
+        if isinstance(value, str):
+            value = value.strip()
+        if field.field_class is BooleanField:
+            if isinstance(value, str):
+                return value.lower() in TRUE_VALUES
+            return bool(value)
+        if value is None or value == '' or value == []:
+            return None
+        if field.field_class is SelectMultipleField:
+            if isinstance(value, str):
+                value = value.split(',')
+            return [str(item).strip() for item in value if str(item).strip()]
+        if field.field_class is DateTimeField:
+            if isinstance(value, datetime):
+                return value
+            try:
+                return datetime.strptime(
+                    value, field.kwargs.get('format', '%Y-%m-%d %H:%M:%S'))
+            except ValueError:
+                try:
+                    return datetime.fromisoformat(value)
+                except ValueError:
+                    raise ValueError('Not a valid datetime value')
+        if field.field_class is IntegerField:
+            try:
+                return int(value)
+            except ValueError:
+                raise ValueError('Not a valid integer value')
+        return str(value)
+
+    def clean(self, record):
+        '''
+        Returns {field name: value} for a record, or raises ValueError
+        naming the first field that breaks the form's rules. Empty and
+        missing values go through the validators like an empty form
+        field: accepted without validators or with Optional(), rejected
+        by the others (an empty facebook_link fails URL()).
+        '''
+        if not isinstance(record, dict):
+            raise ValueError('record must be an object')
+        row = {}
+        for name, field in self.fields:
+            try:
+                raw = record.get(name)
+                data = self._coerce(field, raw)
+                self._field.data = data
+                if raw is None:
+                    self._field.raw_data = []
+                else:
+                    self._field.raw_data = (raw if isinstance(raw, list)
+                                            else [raw])
+                for validator in field.kwargs.get('validators', ()):
+                    try:
+                        validator(None, self._field)
+                    except StopValidation as e:
+                        # without a message it ends the chain, as in a form
+                        if e.args and e.args[0]:
+                            raise
+                        break
+                choices = field.kwargs.get('choices')
+                if data is not None and choices and field.field_class in (SelectField,
+                                                     SelectMultipleField):
+                    allowed = {choice for choice, _ in choices}
+                    values = data if isinstance(data, list) else [data]
+                    for value in values:
+                        if value not in allowed:
+                            raise ValueError(
+                                '{!r} is not a valid choice'.format(value))
+            except (StopValidation, ValidationError, ValueError) as e:
+                raise ValueError('{}: {}'.format(name, e))
+            row[name] = data
+        return row
+
+
+RULES = {
+    'venues': FormRules(VenueForm),
+    'artists': FormRules(ArtistForm),
+    'shows': FormRules(ShowForm),
+}
+
+# owner table, genre table and owner column, columns copied from the form data
+OWNER_TABLES = {
+    'venues': ('Venue', 'venue_genres', 'venue_id', (
+        'name', 'city', 'state', 'address', 'phone', 'image_link',
+        'facebook_link', 'seeking_talent', 'seeking_description')),
+    'artists': ('Artist', 'artist_genres', 'artist_id', (
+        'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+        'seeking_venue', 'seeking_description')),
+}
+SHOW_COLUMNS = ('venue_id', 'artist_id', 'start_time', 'duration_minutes')
+
+
+def detect_format(path, file_format):
+    if file_format is not None:
+        return file_format
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    raise click.BadParameter(
+        'cannot tell the format of {}, pass --format'.format(path))
+
+
+def read_records(stream, file_format):
+    '''
+    Yields (line number, record) pairs from a JSON Lines or CSV stream.
+    '''
+    if file_format == 'csv':
+        for record in csv.DictReader(stream):
+            yield getattr(stream, 'line_number', None), record
+        return
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                raise ValueError('line {}: {}'.format(line_number, e))
+
+
+class LineCountingReader(object):
+    '''
+    Wraps a text stream to remember the current line number,
+    which csv.DictReader does not expose per record.
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.line_number = 0
+
+    def __iter__(self):
+        for line in self._stream:
+            self.line_number += 1
+            yield line
+
+
+def copy_rows(db, table, columns, rows):
+    '''
+    Inserts rows with PostgreSQL COPY through the session's
+    connection, so it joins the current transaction.
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            table, ', '.join(columns)), buffer)
+    finally:
+        cursor.close()
+
+
+class CatalogImporter(object):
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, use_copy=None,
+                 skip_invalid=False, checkpoint=DEFAULT_CHECKPOINT):
+        self.db = db
+        self.batch_size = batch_size
+        if use_copy is None:
+            use_copy = db.engine.dialect.name == 'postgresql'
+        self.use_copy = use_copy
+        self.skip_invalid = skip_invalid
+        self.checkpoint = checkpoint
+        self.state = {'files': {}, 'done': {}, 'ids': {'venues': {}, 'artists': {}}}
+
+    def resume(self, files):
+        '''
+        Loads the checkpoint left by a failed run over the same files.
+        Returns the number of records already done.
+        '''
+        if not os.path.exists(self.checkpoint):
+            self.state['files'] = files
+            return 0
+        with open(self.checkpoint) as stream:
+            state = json.load(stream)
+        if state['files'] != files:
+            raise click.ClickException(
+                '{} belongs to an import of other files, remove it to start '
+                'over'.format(self.checkpoint))
+        self.state = state
+        return sum(state['done'].values())
+
+    def _save(self):
+        # replace the checkpoint atomically so a crash never leaves half of it
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'w') as stream:
+            json.dump(self.state, stream)
+        os.replace(temporary, self.checkpoint)
+
+    def finish(self):
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def _insert(self, table, columns, rows):
+        if not rows:
+            return
+        if self.use_copy:
+            copy_rows(self.db, table, columns, rows)
+        else:
+            self.db.session.execute(
+                self.db.metadata.tables[table].insert(), rows)
+
+    def _allocate_ids(self, table, count):
+        if self.db.engine.dialect.name == 'postgresql':
+            return [row[0] for row in self.db.session.execute(text(
+                "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                "FROM generate_series(1, :count)"),
+                {'table': '"{}"'.format(table), 'count': count})]
+        last_id = self.db.session.execute(text(
+            'SELECT coalesce(max(id), 0) FROM "{}"'.format(table))).scalar()
+        return list(range(last_id + 1, last_id + 1 + count))
+
+    def _resolve(self, kind, reference):
+        if reference is None:
+            raise ValueError('{}: This field is required.'.format(kind[:-1] + '_id'))
+        database_id = self.state['ids'][kind].get(str(reference))
+        if database_id is None:
+            raise ValueError('unknown {} {}'.format(kind[:-1], reference))
+        return database_id
+
+    def clean(self, kind, record):
+        row = RULES[kind].clean(record)
+        if kind == 'shows':
+            return {'venue_id': self._resolve('venues', row['venue_id']),
+                    'artist_id': self._resolve('artists', row['artist_id']),
+                    'start_time': row['start_time'],
+                    'duration_minutes': row['duration'] or DEFAULT_DURATION_MINUTES}
+        row['website'] = row.pop('website_link')
+        row['file_id'] = record.get('id')
+        return row
+
+    def _flush(self, kind, batch, done):
+        new_ids = {}
+        if kind == 'shows':
+            self._insert('Show', SHOW_COLUMNS, batch)
+        else:
+            table, genre_table, owner_column, columns = OWNER_TABLES[kind]
+            columns = ('id', 'website') + columns
+            genres = []
+            for row, database_id in zip(batch, self._allocate_ids(table, len(batch))):
+                row['id'] = database_id
+                if row['file_id'] not in (None, ''):
+                    new_ids[str(row['file_id'])] = database_id
+                genres.extend({owner_column: database_id, 'genre': genre}
+                              for genre in row['genres'] or ())
+            self._insert(table, columns, [{column: row[column] for column in columns}
+                                          for row in batch])
+            self._insert(genre_table, (owner_column, 'genre'), genres)
+        self.db.session.commit()
+        if new_ids:
+            self.state['ids'][kind].update(new_ids)
+        self.state['done'][kind] = done
+        self._save()
+
+    def import_records(self, kind, records):
+        '''
+        Validates and inserts (line number, record) pairs of one kind,
+        committing and checkpointing every batch_size rows and skipping
+        the records a previous run already did. Returns (inserted, skipped).
+        '''
+        already_done = self.state['done'].get(kind, 0)
+        done = inserted = skipped = 0
+        batch = []
+        for line_number, record in records:
+            done += 1
+            if done <= already_done:
+                continue
+            try:
+                batch.append(self.clean(kind, record))
+            except ValueError as e:
+                if not self.skip_invalid:
+                    self.db.session.rollback()
+                    raise ValueError('{} record {}: {}'.format(
+                        kind, line_number or done, e))
+                skipped += 1
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(kind, batch, done)
+                inserted += len(batch)
+                batch = []
+        self._flush(kind, batch, done)
+        inserted += len(batch)
+        return inserted, skipped
+
+
+def import_files(importer, files, formats, report=click.echo):
+    '''
+    Imports {kind: path} in dependency order, reporting the throughput
+    of each file. Returns the number of shows inserted.
+    '''
+    shows = 0
+    for kind in KINDS:
+        path = files.get(kind)
+        if path is None:
+            continue
+        started = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as stream:
+            reader = LineCountingReader(stream)
+            inserted, skipped = importer.import_records(
+                kind, read_records(reader, formats[kind]))
+        elapsed = time.perf_counter() - started
+        report('imported {} {} ({} skipped) in {:.2f}s, {:.0f} rows/sec'.format(
+            inserted, kind, skipped, elapsed,
+            inserted / elapsed if elapsed else 0))
+        if kind == 'shows':
+            shows = inserted
+    return shows
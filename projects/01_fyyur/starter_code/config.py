@@ -1,5 +1,7 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Only good for a single process; production reads a shared one from the
+# environment (see config_production.py).
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -9,5 +11,21 @@ DEBUG = True
 # Connect to the database
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Rendered listing pages are cached for this many seconds (see page_cache.py).
+PAGE_CACHE_SIZE = 512
+PAGE_CACHE_TTL = 60
+# The home page feeds are reconciled with the database this often (see feeds.py).
+HOME_FEED_MAX_AGE = 300
+# The autocomplete index is rebuilt from the database this often (see search.py).
+SUGGEST_INDEX_MAX_AGE = 300
+
+# Outside debug mode logs go through a queue to a size-rotated file.
+LOG_FILE = os.path.join(basedir, 'error.log')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# Requests slower than this are logged with the SQL they ran.
+SLOW_REQUEST_MS = 500
@@ -0,0 +1,31 @@
+import os
+from config import *
+
+'''
+Production profile, loaded over config.py when FYYUR_CONFIG=production.
+The session cookie that carries flashed messages and the CSRF tokens of
+the forms are signed with SECRET_KEY, and a request may reach any worker
+process, so they all need the same key: it must come from the
+environment.
+'''
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('SECRET_KEY')
+if not SECRET_KEY:
+    raise RuntimeError('SECRET_KEY must be set when FYYUR_CONFIG=production')
+
+# Per worker process: pool_size connections kept open, up to max_overflow
+# more under load. pre_ping replaces connections the server dropped and
+# recycle closes them before server-side idle timeouts do.
+if not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+# one log file per worker process, see request_log.QueuedLogging
+LOG_FILE = os.environ.get('LOG_FILE', os.path.join(basedir, 'logs', 'fyyur-{pid}.log'))
@@ -0,0 +1,71 @@
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+'''
+The datetime Jinja filter.
+
+DateTimeFilter formats show times with Babel patterns like the original
+format_datetime filter, without the per-call overhead: datetime values
+are used as they are (strings are still accepted and parsed once), the
+Babel locale and compiled pattern of each format are looked up once,
+and formatted values are memoized, since listings repeat the same start
+times many times over. format_many() formats a whole list of values.
+'''
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+MEMO_SIZE = 8192
+
+
+def parse_datetime(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+class DateTimeFilter(object):
+
+    def __init__(self, locale='en', formats=FORMATS, memo_size=MEMO_SIZE):
+        self.locale = Locale.parse(locale)
+        self.formats = dict(formats)
+        self._patterns = {}
+        self._format = lru_cache(maxsize=memo_size)(self._format_value)
+
+    def pattern(self, format):
+        # dict reads are atomic, a race only compiles a pattern twice
+        pattern = self._patterns.get(format)
+        if pattern is None:
+            pattern = parse_pattern(self.formats.get(format, format))
+            self._patterns[format] = pattern
+        return pattern
+
+    def _format_value(self, value, format):
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        return self.pattern(format).apply(value, self.locale)
+
+    def __call__(self, value, format='medium'):
+        return self._format(value, format)
+
+    def format_many(self, values, format='medium'):
+        '''
+        Formats every value of the list, each distinct value once.
+        '''
+        formatted = {}
+        results = []
+        for value in values:
+            text = formatted.get(value)
+            if text is None:
+                text = formatted[value] = self._format(value, format)
+            results.append(text)
+        return results
+
+    def cache_info(self):
+        return self._format.cache_info()
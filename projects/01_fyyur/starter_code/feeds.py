@@ -0,0 +1,100 @@
+import threading
+import time
+
+'''
+Home page feeds: the most recently listed venues and artists and the
+venues with the most upcoming shows.
+
+Each feed is a TopN, the best few items of a ranking kept in memory so
+the home page never runs an ORDER BY. The handlers that create and
+delete venues, artists and shows offer() the new score of what they
+changed after their commit. The ranking is reconciled with the database
+(by calling loader() again) at most max_age seconds after the last
+load, which also picks up what other processes changed, and earlier
+when a tracked item drops below one the feed no longer tracks.
+'''
+
+DEFAULT_SIZE = 10
+DEFAULT_MAX_AGE = 300
+
+
+class TopN(object):
+    '''
+    The top size items by score, plus as many again as slack so that
+    items moving down rarely force a reload. loader(limit) returns up
+    to limit (key, score, item) rows, best first; ties rank the higher
+    key first.
+
+    Every item not tracked ranks at most floor, the highest
+    (score, key) dropped so far (None while every item is tracked), so
+    the ranking read from the tracked items holds as long as the
+    size-th of them ranks above floor.
+    '''
+
+    def __init__(self, loader, size=DEFAULT_SIZE, slack=None,
+                 max_age=DEFAULT_MAX_AGE, clock=time.monotonic):
+        self._loader = loader
+        self.size = size
+        self.capacity = size + (size if slack is None else slack)
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = None
+        self._floor = None
+        self._loaded_at = None
+        self.loads = 0
+
+    def _load(self):
+        # called with the lock held
+        rows = list(self._loader(self.capacity + 1))
+        self._entries = {key: (score, item)
+                         for key, score, item in rows[:self.capacity]}
+        self._floor = None
+        if len(rows) > self.capacity:
+            key, score, _ = rows[self.capacity]
+            self._floor = (score, key)
+        self._loaded_at = self._clock()
+        self.loads += 1
+
+    def _ranked(self):
+        # called with the lock held
+        ranked = sorted(((score, key, item) for key, (score, item)
+                         in self._entries.items()), reverse=True)
+        return ranked[:self.size]
+
+    def offer(self, key, score, item):
+        with self._lock:
+            # not loaded yet: the loader will pick the item up
+            if self._entries is None:
+                return
+            if (key not in self._entries and self._floor is not None
+                    and (score, key) <= self._floor):
+                return
+            self._entries[key] = (score, item)
+            if len(self._entries) > self.capacity:
+                lowest = min((entry_score, entry_key) for entry_key, (entry_score, _)
+                             in self._entries.items())
+                del self._entries[lowest[1]]
+                if self._floor is None or lowest > self._floor:
+                    self._floor = lowest
+
+    def discard(self, key):
+        with self._lock:
+            if self._entries is not None:
+                self._entries.pop(key, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = None
+
+    def items(self):
+        with self._lock:
+            if (self._entries is None
+                    or self._clock() - self._loaded_at >= self.max_age):
+                self._load()
+            ranked = self._ranked()
+            if self._floor is not None and (
+                    len(ranked) < self.size or ranked[-1][:2] < self._floor):
+                self._load()
+                ranked = self._ranked()
+            return [item for _, _, item in ranked]
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+
+'''
+Preforking production launcher:
+
+    SECRET_KEY=... DATABASE_URL=... gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is imported once in the master (preload_app) and forked into
+one worker per core by default. The master exports raw_env before it
+imports the app, so the app is configured from config_production
+unless FYYUR_CONFIG says otherwise. Database connections and the log
+writer thread must not be shared across processes, so the engine's
+pool is emptied before every fork and each worker starts its own log
+writer.
+
+The in-memory indexes and caches of the app are loaded lazily, so each
+worker builds its own after the fork and reconciles it with the
+database on its own schedule (see the README). On SQLite the booking
+conflicts are checked from the in-memory show schedule, which only
+holds for one process, so a SQLite database gets a single worker.
+'''
+
+bind = os.environ.get('BIND', '0.0.0.0:{}'.format(os.environ.get('PORT', '8000')))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+if os.environ.get('DATABASE_URL', '').startswith('sqlite'):
+    workers = 1
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = True
+raw_env = ['FYYUR_CONFIG={}'.format(os.environ.get('FYYUR_CONFIG', 'production'))]
+
+
+def pre_fork(server, worker):
+    from app import db
+    db.engine.dispose()
+
+
+def post_fork(server, worker):
+    from app import db, queued_logging
+    # a fresh pool in the worker; nothing was inherited after pre_fork
+    db.engine.dispose()
+    if queued_logging is not None:
+        queued_logging.after_fork()
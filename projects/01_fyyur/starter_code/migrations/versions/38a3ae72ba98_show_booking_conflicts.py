@@ -0,0 +1,45 @@
+"""show durations and booking conflict constraints
+
+Revision ID: 38a3ae72ba98
+Revises: 7c21d5e94a3b
+Create Date: 2026-10-18 03:40:48.528192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '38a3ae72ba98'
+down_revision = '7c21d5e94a3b'
+branch_labels = None
+depends_on = None
+
+# constraint -> owner column (see bookings.EXCLUSION_CONSTRAINTS); the
+# tsrange expression must match app.show_period()
+EXCLUSION_CONSTRAINTS = {
+    'show_venue_no_overlap': 'venue_id',
+    'show_artist_no_overlap': 'artist_id',
+}
+SHOW_PERIOD = ("tsrange(start_time, "
+               "start_time + duration_minutes * interval '1 minute')")
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False))
+    if op.get_bind().dialect.name == 'postgresql':
+        # btree_gist lets the GiST index take the owner id with =; fails on
+        # existing overlapping shows, which have to be moved first
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for name, column in EXCLUSION_CONSTRAINTS.items():
+            op.execute(
+                'ALTER TABLE "Show" ADD CONSTRAINT {} EXCLUDE USING gist '
+                '({} WITH =, {} WITH &&)'.format(name, column, SHOW_PERIOD))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name in EXCLUSION_CONSTRAINTS:
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS {}'.format(name))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('duration_minutes')
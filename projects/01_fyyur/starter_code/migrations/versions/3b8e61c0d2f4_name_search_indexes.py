@@ -0,0 +1,67 @@
+"""name search indexes for venues and artists
+
+Revision ID: 3b8e61c0d2f4
+Revises: 17a36ef47fb8
+Create Date: 2026-10-18 03:40:12.418220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e61c0d2f4'
+down_revision = '17a36ef47fb8'
+branch_labels = None
+depends_on = None
+
+# table -> FTS5 table used on SQLite (see search.FTS_TABLES)
+FTS_TABLES = {
+    'Venue': 'venue_name_fts',
+    'Artist': 'artist_name_fts',
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in FTS_TABLES:
+            op.execute(
+                'CREATE INDEX ix_{0}_name_trgm ON "{1}" '
+                'USING gin (name gin_trgm_ops)'.format(table.lower(), table))
+    elif dialect == 'sqlite':
+        for table, fts in FTS_TABLES.items():
+            op.execute(
+                "CREATE VIRTUAL TABLE {0} USING fts5(name, "
+                "content='{1}', content_rowid='id', tokenize='trigram')".format(
+                    fts, table))
+            op.execute(
+                "CREATE TRIGGER {0}_insert AFTER INSERT ON \"{1}\" BEGIN "
+                "INSERT INTO {0}(rowid, name) VALUES (new.id, new.name); "
+                "END".format(fts, table))
+            op.execute(
+                "CREATE TRIGGER {0}_delete AFTER DELETE ON \"{1}\" BEGIN "
+                "INSERT INTO {0}({0}, rowid, name) "
+                "VALUES ('delete', old.id, old.name); END".format(fts, table))
+            op.execute(
+                "CREATE TRIGGER {0}_update AFTER UPDATE OF name ON \"{1}\" "
+                "BEGIN "
+                "INSERT INTO {0}({0}, rowid, name) "
+                "VALUES ('delete', old.id, old.name); "
+                "INSERT INTO {0}(rowid, name) VALUES (new.id, new.name); "
+                "END".format(fts, table))
+            op.execute("INSERT INTO {0}({0}) VALUES ('rebuild')".format(fts))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in FTS_TABLES:
+            op.execute('DROP INDEX IF EXISTS ix_{}_name_trgm'.format(
+                table.lower()))
+    elif dialect == 'sqlite':
+        for fts in FTS_TABLES.values():
+            for event in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER IF EXISTS {}_{}'.format(fts, event))
+            op.execute('DROP TABLE IF EXISTS {}'.format(fts))
@@ -0,0 +1,42 @@
+"""cascade deletes from venues and artists to their shows
+
+Revision ID: 7c21d5e94a3b
+Revises: 393ccfa25181
+Create Date: 2026-10-18 03:38:41.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c21d5e94a3b'
+down_revision = '393ccfa25181'
+branch_labels = None
+depends_on = None
+
+# the initial revision left the foreign keys unnamed; this names them the
+# way PostgreSQL did and the SQLite batch reflection does
+NAMING_CONVENTION = {
+    'fk': '%(table_name)s_%(column_0_name)s_fkey',
+}
+FOREIGN_KEYS = (
+    ('Show_venue_id_fkey', 'Venue', 'venue_id'),
+    ('Show_artist_id_fkey', 'Artist', 'artist_id'),
+)
+
+
+def replace_foreign_keys(ondelete):
+    with op.batch_alter_table('Show', naming_convention=NAMING_CONVENTION) as batch_op:
+        for name, referred_table, column in FOREIGN_KEYS:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(
+                name, referred_table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -0,0 +1,28 @@
+"""venue and artist versions for optimistic concurrency
+
+Revision ID: b9ca3fe94ac9
+Revises: 38a3ae72ba98
+Create Date: 2026-10-18 03:44:12.525346
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9ca3fe94ac9'
+down_revision = '38a3ae72ba98'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    # a plain DROP COLUMN (SQLite 3.35+) rather than a batch copy, which
+    # would drop the name search triggers on these tables
+    op.drop_column('Venue', 'version')
+    op.drop_column('Artist', 'version')
@@ -0,0 +1,110 @@
+"""normalize genres into venue_genres and artist_genres
+
+Revision ID: fc4c393569dd
+Revises: 3b8e61c0d2f4
+Create Date: 2026-10-18 03:31:11.639204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fc4c393569dd'
+down_revision = '3b8e61c0d2f4'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 1000
+
+# table, genre table, owner column
+GENRE_TABLES = (
+    ('Venue', 'venue_genres', 'venue_id'),
+    ('Artist', 'artist_genres', 'artist_id'),
+)
+
+
+def split_genres(value):
+    # "Jazz,Folk" as written by the create forms; "{Jazz,Folk}" as left
+    # behind by rows written as PostgreSQL array literals
+    if not value:
+        return []
+    genres = []
+    for genre in value.strip('{}').split(','):
+        genre = genre.strip().strip('"').strip()
+        if genre and genre not in genres:
+            genres.append(genre[:50])
+    return genres
+
+
+def owner_batches(connection, table, columns):
+    # keyset pagination over the owner table by id
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            'SELECT {} FROM "{}" WHERE id > :last_id ORDER BY id '
+            'LIMIT :batch_size'.format(columns, table)),
+            last_id=last_id, batch_size=BATCH_SIZE).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table('artist_genres',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre')
+    )
+    op.create_table('venue_genres',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre')
+    )
+    op.create_index('ix_artist_area', 'Artist', ['state', 'city', 'name', 'id'], unique=False)
+
+    connection = op.get_bind()
+    for table, genre_table, owner_column in GENRE_TABLES:
+        genres = sa.table(genre_table, sa.column(owner_column), sa.column('genre'))
+        for rows in owner_batches(connection, table, 'id, genres'):
+            values = [{owner_column: owner_id, 'genre': genre}
+                      for owner_id, value in rows
+                      for genre in split_genres(value)]
+            if values:
+                connection.execute(genres.insert(), values)
+
+    # built after the backfill, which is cheaper than maintaining them row by row
+    op.create_index('ix_artist_genres_genre', 'artist_genres', ['genre', 'artist_id'], unique=False)
+    op.create_index('ix_venue_genres_genre', 'venue_genres', ['genre', 'venue_id'], unique=False)
+    op.drop_column('Artist', 'genres')
+    op.drop_column('Venue', 'genres')
+
+
+def downgrade():
+    op.add_column('Venue', sa.Column('genres', sa.VARCHAR(length=120), nullable=True))
+    op.add_column('Artist', sa.Column('genres', sa.VARCHAR(length=120), nullable=True))
+
+    connection = op.get_bind()
+    for table, genre_table, owner_column in GENRE_TABLES:
+        owners = sa.table(table, sa.column('id'), sa.column('genres'))
+        for rows in owner_batches(connection, table, 'id'):
+            ids = [owner_id for owner_id, in rows]
+            genres = {}
+            for owner_id, genre in connection.execute(sa.text(
+                    'SELECT {0}, genre FROM {1} WHERE {0} BETWEEN :first AND :last '
+                    'ORDER BY {0}, genre'.format(owner_column, genre_table)),
+                    first=ids[0], last=ids[-1]):
+                genres.setdefault(owner_id, []).append(genre)
+            for owner_id, names in genres.items():
+                connection.execute(owners.update().where(
+                    owners.c.id == owner_id).values(genres=','.join(names)[:120]))
+
+    op.drop_index('ix_artist_area', table_name='Artist')
+    op.drop_index('ix_venue_genres_genre', table_name='venue_genres')
+    op.drop_table('venue_genres')
+    op.drop_index('ix_artist_genres_genre', table_name='artist_genres')
+    op.drop_table('artist_genres')
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+'''
+Rendered page cache for the listing pages.
+
+Pages are cached as rendered HTML under (endpoint, query args) in an
+LRU with a TTL, and tagged with the data they show ('venues', 'artists',
+'shows'). Handlers that change that data call invalidate() with the
+matching tags after their commit, so a hit never needs the database or
+Jinja. The cache is per process: in a multi-worker deployment the TTL
+bounds how long other workers can serve a page written elsewhere.
+'''
+
+DEFAULT_MAXSIZE = 512
+DEFAULT_TTL = 60
+
+
+class PageCache(object):
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL,
+                 clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires, page, tags), least recently used first
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        # called with the lock held
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, page, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (self._clock() + self.ttl, page, tuple(tags))
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self._entries),
+                    'maxsize': self.maxsize,
+                    'ttl': self.ttl}
+
+    def cached(self, *tags):
+        '''
+        Caches the page a view returns under its endpoint and query
+        args. Requests with pending flash messages bypass the cache,
+        since the layout renders them into the page.
+        '''
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if session.get('_flashes'):
+                    return view(*args, **kwargs)
+                key = (request.endpoint, tuple(kwargs.items()),
+                       tuple(sorted(request.args.items(multi=True))))
+                page = self.get(key)
+                if page is None:
+                    page = view(*args, **kwargs)
+                    if isinstance(page, str):
+                        self.set(key, page, tags)
+                return page
+            return wrapper
+        return decorator
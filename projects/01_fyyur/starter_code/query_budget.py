@@ -0,0 +1,45 @@
+from flask import current_app, request
+
+import sql_stats
+
+'''
+Per-request SQL statement budget.
+
+QueryBudget counts the statements every request sends to the database.
+Endpoints listed in its budgets may issue at most that many statements,
+however much data they render; in debug and testing mode a request that
+goes over fails with QueryBudgetExceeded, so an N+1 regression on a page
+shows up the first time the page is rendered or requested by a test.
+'''
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget(object):
+
+    def __init__(self, app=None, budgets=None):
+        self.budgets = dict(budgets or {})
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        sql_stats.init_app(app)
+        app.after_request(self._check)
+
+    @staticmethod
+    def statements():
+        return sql_stats.current().count
+
+    def _check(self, response):
+        budget = self.budgets.get(request.endpoint)
+        if budget is None:
+            return response
+        if not (current_app.debug or current_app.testing):
+            return response
+        if self.statements() > budget:
+            raise QueryBudgetExceeded(
+                '{} issued {} SQL statements, its budget is {}'.format(
+                    request.endpoint, self.statements(), budget))
+        return response
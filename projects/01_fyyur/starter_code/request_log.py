@@ -0,0 +1,127 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, request
+
+import sql_stats
+
+'''
+Non-blocking logging and per-request timing.
+
+start_queued_logging() puts a QueueHandler on the given loggers, so a
+log call on a request thread only enqueues the record; a QueueListener
+thread writes the records to a size-rotated file (see QueuedLogging).
+
+RequestLog logs one JSON record per request on the 'fyyur.requests'
+logger with its route, status, latency, time spent in the database and
+number of SQL statements. Requests slower than slow_ms are logged as
+warnings that also carry the SQL statements they ran.
+'''
+
+LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
+REQUEST_LOGGER = 'fyyur.requests'
+
+
+class QueuedLogging(object):
+    '''
+    Loggers routed through a queue to a RotatingFileHandler that a
+    QueueListener thread writes. Threads do not survive fork(), so a
+    preforked worker calls after_fork() to get a queue and writer thread
+    of its own; "{pid}" in the path is replaced by the process id so
+    that workers never rotate each other's files.
+    '''
+
+    def __init__(self, loggers, path, max_bytes, backup_count,
+                 level=logging.INFO):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.level = level
+        self.listener = None
+        self.handler = QueueHandler(queue.Queue(-1))
+        for logger in loggers:
+            logger.setLevel(level)
+            logger.addHandler(self.handler)
+
+    def start(self):
+        records = queue.Queue(-1)
+        file_handler = RotatingFileHandler(
+            self.path.format(pid=os.getpid()), maxBytes=self.max_bytes,
+            backupCount=self.backup_count)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        file_handler.setLevel(self.level)
+        self.handler.queue = records
+        self.listener = QueueListener(records, file_handler,
+                                      respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        # drains the queue before returning
+        if self.listener is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+            self.listener = None
+
+    def after_fork(self):
+        # the listener copied from the parent has no thread in this process
+        self.listener = None
+        self.start()
+
+
+def start_queued_logging(loggers, path, max_bytes, backup_count,
+                         level=logging.INFO):
+    '''
+    Starts QueuedLogging for the loggers and stops it (draining the
+    queue) at interpreter exit.
+    '''
+    queued = QueuedLogging(loggers, path, max_bytes, backup_count, level)
+    queued.start()
+    atexit.register(queued.stop)
+    return queued
+
+
+class RequestLog(object):
+
+    def __init__(self, app=None, slow_ms=None, logger=None):
+        self.slow_ms = slow_ms
+        self.logger = logger or logging.getLogger(REQUEST_LOGGER)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        sql_stats.init_app(app)
+        app.before_request(self._start)
+        app.after_request(self._log)
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+
+    def _log(self, response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        stats = sql_stats.current()
+        fields = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else request.path,
+            'path': request.full_path if request.query_string else request.path,
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'db_ms': round(stats.seconds * 1000, 2),
+            'sql_count': stats.count,
+        }
+        if self.slow_ms is not None and fields['latency_ms'] >= self.slow_ms:
+            fields['slow'] = True
+            fields['sql'] = [{'statement': statement,
+                              'ms': round(seconds * 1000, 2)}
+                             for statement, seconds in stats.statements]
+            self.logger.warning(json.dumps(fields), extra={'request': fields})
+        else:
+            self.logger.info(json.dumps(fields), extra={'request': fields})
+        return response
@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import column, select, table, text
+
+'''
+Name search for venues and artists.
+
+name_filter() builds the WHERE clause for a case-insensitive partial
+match on a model's name that the database can answer from an index
+(created by the name search migration) instead of a leading-wildcard
+LIKE scan:
+
+    PostgreSQL: ILIKE served by a pg_trgm GIN index on name.
+    SQLite:     an FTS5 trigram table kept in sync by triggers.
+
+Terms shorter than a trigram fall back to a plain LIKE.
+
+PrefixIndex backs GET /search/suggest from memory.
+'''
+
+DEFAULT_MAX_AGE = 300
+
+FTS_TABLES = {
+    'Venue': 'venue_name_fts',
+    'Artist': 'artist_name_fts',
+}
+TRIGRAM_LENGTH = 3
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return '%{}%'.format(escaped)
+
+
+def name_filter(db, model, term):
+    if (db.engine.dialect.name == 'sqlite' and len(term) >= TRIGRAM_LENGTH
+            and model.__tablename__ in FTS_TABLES):
+        fts = FTS_TABLES[model.__tablename__]
+        matches = select([column('rowid')]).select_from(table(fts)).where(
+            text('{} MATCH :name_match'.format(fts)).bindparams(
+                name_match='"{}"'.format(term.replace('"', '""'))))
+        return model.id.in_(matches)
+    return model.name.ilike(like_pattern(term), escape='\\')
+
+
+class PrefixIndex(object):
+    '''
+    In-memory autocomplete index over (kind, id, name) entries.
+    Every word of a name starts a key, so "hop" suggests
+    "The Musical Hop". Keys live in one sorted list and a lookup is a
+    bisect to the first key with the prefix, then a short walk.
+
+    The index is loaded by calling loader() on first use and then kept
+    up to date by add(), update() and remove() as names change. It is
+    rebuilt from loader() once it is more than max_age seconds old,
+    which picks up what other processes changed.
+    '''
+
+    def __init__(self, loader, max_age=DEFAULT_MAX_AGE, clock=time.monotonic):
+        self._loader = loader
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys = None
+        self._names = {}
+        self._loaded_at = None
+
+    @staticmethod
+    def _word_keys(name):
+        lowered = name.lower()
+        return [lowered[match.start():]
+                for match in WORD_PATTERN.finditer(lowered)]
+
+    def _insert(self, kind, entry_id, name):
+        self._names[(kind, entry_id)] = name
+        for key in self._word_keys(name):
+            insort(self._keys, (key, kind, entry_id))
+
+    def _delete(self, kind, entry_id):
+        name = self._names.pop((kind, entry_id), None)
+        if name is None:
+            return
+        for key in self._word_keys(name):
+            position = bisect_left(self._keys, (key, kind, entry_id))
+            if (position < len(self._keys)
+                    and self._keys[position] == (key, kind, entry_id)):
+                del self._keys[position]
+
+    def _ensure_loaded(self):
+        # called with the lock held
+        if (self._keys is not None
+                and self._clock() - self._loaded_at < self.max_age):
+            return
+        self._keys = []
+        self._names = {}
+        entries = []
+        for kind, entry_id, name in self._loader():
+            if name:
+                self._names[(kind, entry_id)] = name
+                entries.extend((key, kind, entry_id)
+                               for key in self._word_keys(name))
+        entries.sort()
+        self._keys = entries
+        self._loaded_at = self._clock()
+
+    def add(self, kind, entry_id, name):
+        with self._lock:
+            # not loaded yet: the loader will pick the entry up
+            if self._keys is None:
+                return
+            self._delete(kind, entry_id)
+            if name:
+                self._insert(kind, entry_id, name)
+
+    update = add
+
+    def remove(self, kind, entry_id):
+        with self._lock:
+            if self._keys is not None:
+                self._delete(kind, entry_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._names = {}
+
+    def suggest(self, prefix, limit=10):
+        '''
+        Returns up to limit (kind, id, name) entries with a word
+        starting with prefix, in key order.
+        '''
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            results = []
+            seen = set()
+            position = bisect_left(self._keys, (prefix,))
+            while position < len(self._keys) and len(results) < limit:
+                key, kind, entry_id = self._keys[position]
+                if not key.startswith(prefix):
+                    break
+                if (kind, entry_id) not in seen:
+                    seen.add((kind, entry_id))
+                    results.append((kind, entry_id,
+                                    self._names[(kind, entry_id)]))
+                position += 1
+            return results
@@ -0,0 +1,74 @@
+import time
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+Per-request SQL statistics.
+
+Once install() has been called, every statement executed inside an
+application context is counted and timed in that context's
+RequestSqlStats (see current()). The first MAX_RECORDED statements are
+kept with their durations so slow requests can be reported with the
+SQL they ran.
+
+Requests made inside an application context that is already pushed
+(e.g. by a test) share it, so init_app() starts every request with
+fresh statistics.
+'''
+
+MAX_RECORDED = 200
+
+_installed = False
+
+
+class RequestSqlStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.statements) < MAX_RECORDED:
+            self.statements.append((statement, seconds))
+
+
+def current():
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = RequestSqlStats()
+    return stats
+
+
+def reset():
+    g.sql_stats = RequestSqlStats()
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        conn.info.setdefault('sql_started', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('sql_started')
+    if has_app_context() and started:
+        current().record(statement, time.perf_counter() - started.pop())
+
+
+def install():
+    global _installed
+    if not _installed:
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+        _installed = True
+
+
+def init_app(app):
+    install()
+    if 'sql_stats' not in app.extensions:
+        app.extensions['sql_stats'] = True
+        app.before_request(reset)
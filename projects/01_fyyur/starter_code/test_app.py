@@ -0,0 +1,1474 @@
+import importlib
+import os
+import re
+import runpy
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from html import unescape
+from unittest import mock
+
+import babel.dates
+import sqlalchemy as sa
+from flask import Flask
+from flask_migrate import downgrade, upgrade
+from flask_sqlalchemy import SQLAlchemy
+from gunicorn.app.base import BaseApplication
+from gunicorn.arbiter import Arbiter
+
+"""
+Test harness.
+By default the tests run against an in-memory SQLite database, created
+once per process with the Alembic revisions, so they need no
+PostgreSQL. Set FYYUR_TEST_DATABASE_URL to use another database; its
+tables are emptied after every test.
+"""
+TEST_DATABASE_URL = os.environ.get('FYYUR_TEST_DATABASE_URL', 'sqlite://')
+# config.py reads the database URL when app is imported
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+import app as fyyur  # noqa: E402
+from app import db, Artist, ArtistGenre, Show, Venue, VenueGenre  # noqa: E402
+from datetime_filter import FORMATS, DateTimeFilter  # noqa: E402
+from feeds import TopN  # noqa: E402
+from query_budget import QueryBudgetExceeded  # noqa: E402
+from search import PrefixIndex  # noqa: E402
+
+MIGRATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+fyyur.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+
+
+# A venue page that loads the artist of every show on its own, to check
+# that the query budget catches N+1 queries.
+@fyyur.app.route('/test/n-plus-one/<int:venue_id>')
+def n_plus_one_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    return ', '.join(show.artist.name for show in venue.shows)
+
+
+fyyur.query_budget.budgets['n_plus_one_venue'] = 4
+
+_migrated = False
+
+
+def migrate():
+    """Create the tables once per process."""
+    global _migrated
+    if not _migrated:
+        with fyyur.app.app_context():
+            upgrade(directory=MIGRATIONS_PATH)
+        _migrated = True
+
+
+def reset():
+    """Empty every table and drop what the app keeps in memory."""
+    with fyyur.app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        db.session.remove()
+    fyyur.page_cache.clear()
+    fyyur.suggest_index.invalidate()
+    fyyur.show_schedule.invalidate()
+    fyyur.recent_venues.invalidate()
+    fyyur.recent_artists.invalidate()
+    fyyur.trending_venues.invalidate()
+
+
+def add_venue(name='The Musical Hop', genres=('Jazz',), city='San Francisco',
+              state='CA', **columns):
+    venue = Venue(name=name, city=city, state=state,
+                  address='1015 Folsom Street', genres=list(genres),
+                  **columns)
+    db.session.add(venue)
+    db.session.commit()
+    return venue.id
+
+
+def add_artist(name='Guns N Petals', genres=('Rock n Roll',)):
+    artist = Artist(name=name, city='San Francisco', state='CA',
+                    genres=list(genres))
+    db.session.add(artist)
+    db.session.commit()
+    return artist.id
+
+
+def add_show(venue_id, artist_id, start_time, duration_minutes=60):
+    show = Show(venue_id=venue_id, artist_id=artist_id,
+                start_time=start_time, duration_minutes=duration_minutes)
+    db.session.add(show)
+    fyyur.count_new_show(show)
+    db.session.commit()
+    return show.id
+
+
+class FyyurTestCase(unittest.TestCase):
+    """Base class: an empty database and a test client per test."""
+
+    def setUp(self):
+        migrate()
+        self.app = fyyur.app
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        reset()
+
+    def seed_busy_venue(self, shows=20):
+        """A venue and an artist with many past and upcoming shows,
+        half of them with other artists and venues."""
+        now = datetime.now()
+        with self.app.app_context():
+            venue_id = add_venue()
+            artist_id = add_artist()
+            other_venues = [add_venue('Venue {}'.format(i))
+                            for i in range(3)]
+            other_artists = [add_artist('Artist {}'.format(i))
+                             for i in range(3)]
+            for i in range(shows):
+                for days in (-(i + 1), i + 1):
+                    start = now + timedelta(days=days)
+                    add_show(venue_id, artist_id, start)
+                    add_show(venue_id, other_artists[i % 3],
+                             start + timedelta(hours=2))
+                    add_show(other_venues[i % 3], artist_id,
+                             start + timedelta(hours=4))
+            db.session.remove()
+        return venue_id, artist_id
+
+
+class QueryBudgetTestCase(FyyurTestCase):
+
+    def test_venue_page_stays_within_budget(self):
+        venue_id, _ = self.seed_busy_venue()
+
+        res = self.client.get('/venues/{}'.format(venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+        self.assertIn(b'Artist 2', res.data)
+
+    def test_venue_page_of_past_shows_stays_within_budget(self):
+        venue_id, _ = self.seed_busy_venue()
+
+        res = self.client.get('/venues/{}?past_page=3'.format(venue_id))
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_artist_page_stays_within_budget(self):
+        _, artist_id = self.seed_busy_venue()
+
+        res = self.client.get('/artists/{}'.format(artist_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'Venue 2', res.data)
+
+    def test_home_page_stays_within_budget(self):
+        self.seed_busy_venue()
+
+        res = self.client.get('/')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_budget_is_per_request_inside_one_app_context(self):
+        venue_id, _ = self.seed_busy_venue()
+
+        with self.app.app_context():
+            with self.assertLogs('fyyur.requests', 'INFO') as logs:
+                for _ in range(3):
+                    res = self.client.get('/venues/{}'.format(venue_id))
+                    self.assertEqual(res.status_code, 200)
+
+        # later requests may find the venue in the session, so they can
+        # run fewer statements, never more
+        counts = [record.request['sql_count'] for record in logs.records]
+        self.assertEqual(len(counts), 3)
+        self.assertLessEqual(counts[0],
+                             fyyur.query_budget.budgets['show_venue'])
+        self.assertEqual(sorted(counts, reverse=True), counts)
+
+    def test_n_plus_one_page_exceeds_budget(self):
+        venue_id, _ = self.seed_busy_venue()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/test/n-plus-one/{}'.format(venue_id))
+
+
+class ShowListingTestCase(FyyurTestCase):
+
+    def seed_shows(self, start_times):
+        """One show per start time, each by its own artist.
+        Returns the artist names in (start_time, show id) order."""
+        with self.app.app_context():
+            venue_id = add_venue()
+            shows = []
+            for i, start in enumerate(start_times):
+                name = 'Artist {:02d}'.format(i)
+                show_id = add_show(venue_id, add_artist(name), start)
+                shows.append((start, show_id, name))
+            db.session.remove()
+        return [name for _, _, name in sorted(shows)]
+
+    def get_pages(self, url):
+        """Follows the More shows links from url, returns the artist
+        names of every page."""
+        pages = []
+        while url is not None:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            html = res.get_data(as_text=True)
+            pages.append(re.findall(
+                r'<a href="/artists/\d+">([^<]+)</a>', html))
+            next_page = re.search(
+                r'<li class="next"><a href="([^"]+)">', html)
+            url = unescape(next_page.group(1)) if next_page else None
+        return pages
+
+    def test_shows_pages_through_ties_on_start_time(self):
+        start = datetime.now() + timedelta(days=1)
+        expected = self.seed_shows(
+            [start] * 5 + [start - timedelta(hours=1),
+                           start + timedelta(hours=1)])
+
+        with mock.patch.object(fyyur, 'SHOWS_PER_PAGE', 3):
+            pages = self.get_pages('/shows')
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_past_shows_are_listed_newest_first(self):
+        now = datetime.now()
+        yesterday = now - timedelta(days=1)
+        expected = self.seed_shows(
+            [yesterday] * 3 + [now - timedelta(days=2),
+                               now - timedelta(hours=1),
+                               now + timedelta(days=1)])
+
+        with mock.patch.object(fyyur, 'SHOWS_PER_PAGE', 2):
+            pages = self.get_pages('/shows?when=past')
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected[-2::-1])
+
+    def test_upcoming_shows_in_range(self):
+        now = datetime.now()
+        expected = self.seed_shows(
+            [now + timedelta(days=days) for days in (-1, 1, 2, 3, 9)])
+
+        pages = self.get_pages('/shows?when=upcoming&from={}&to={}'.format(
+            (now + timedelta(days=2)).isoformat(),
+            (now + timedelta(days=4)).isoformat()))
+
+        self.assertEqual(pages, [expected[2:4]])
+
+    def test_400_for_invalid_show_listing_parameters(self):
+        for query in ('when=tomorrow', 'from=yesterday', 'to=2031-13-01',
+                      'after_time=soon&after_id=3'):
+            res = self.client.get('/shows?' + query)
+            self.assertEqual(res.status_code, 400, query)
+
+    def test_stream_lists_every_show_without_paging(self):
+        start = datetime.now() + timedelta(days=1)
+        expected = self.seed_shows(
+            [start + timedelta(hours=i // 2) for i in range(7)])
+
+        with mock.patch.object(fyyur, 'SHOWS_PER_PAGE', 3), \
+                mock.patch.object(fyyur, 'SHOWS_STREAM_BATCH_SIZE', 2):
+            pages = self.get_pages('/shows?stream=true')
+
+        self.assertEqual(pages, [expected])
+
+
+class DeleteTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(DeleteTestCase, self).setUp()
+        now = datetime.now()
+        with self.app.app_context():
+            self.venue_id = add_venue(genres=('Jazz', 'Folk'))
+            self.other_venue_id = add_venue('Park Square', genres=('Jazz',))
+            self.artist_id = add_artist(genres=('Rock n Roll', 'Soul'))
+            self.other_artist_id = add_artist('Matt Quevedo')
+            add_show(self.venue_id, self.artist_id, now - timedelta(days=1))
+            for day, venue_id, artist_id in (
+                    (1, self.venue_id, self.artist_id),
+                    (2, self.venue_id, self.other_artist_id),
+                    (3, self.other_venue_id, self.artist_id),
+                    (4, self.other_venue_id, self.other_artist_id)):
+                add_show(venue_id, artist_id, now + timedelta(days=day))
+            db.session.remove()
+
+    def shows(self):
+        with self.app.app_context():
+            return sorted(db.session.query(Show.venue_id, Show.artist_id))
+
+    def test_delete_venue_removes_its_shows_and_genres(self):
+        res = self.client.delete('/venues/{}'.format(self.venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {'success': True,
+                                          'deleted': self.venue_id,
+                                          'deleted_shows': 3})
+        self.assertEqual(self.shows(), [
+            (self.other_venue_id, self.artist_id),
+            (self.other_venue_id, self.other_artist_id)])
+        with self.app.app_context():
+            self.assertEqual(VenueGenre.query.filter_by(
+                venue_id=self.venue_id).count(), 0)
+            self.assertEqual(VenueGenre.query.filter_by(
+                venue_id=self.other_venue_id).count(), 1)
+        self.assertEqual(self.client.get(
+            '/venues/{}'.format(self.venue_id)).status_code, 404)
+
+    def test_delete_artist_removes_its_shows_and_genres(self):
+        res = self.client.delete('/artists/{}'.format(self.artist_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {'success': True,
+                                          'deleted': self.artist_id,
+                                          'deleted_shows': 3})
+        self.assertEqual(self.shows(), [
+            (self.venue_id, self.other_artist_id),
+            (self.other_venue_id, self.other_artist_id)])
+        with self.app.app_context():
+            self.assertEqual(ArtistGenre.query.filter_by(
+                artist_id=self.artist_id).count(), 0)
+            counts = dict(db.session.query(Venue.id,
+                                           Venue.upcoming_shows_count))
+        self.assertEqual(counts, {self.venue_id: 1, self.other_venue_id: 1})
+        self.assertEqual(self.client.get(
+            '/artists/{}'.format(self.artist_id)).status_code, 404)
+
+    def test_404_for_delete_of_missing_venue_or_artist(self):
+        for url in ('/venues/999', '/artists/999'):
+            res = self.client.delete(url)
+            self.assertEqual(res.status_code, 404, url)
+        self.assertEqual(len(self.shows()), 5)
+
+
+def upcoming_counts():
+    """{venue name: upcoming_shows_count}"""
+    with fyyur.app.app_context():
+        return dict(db.session.query(Venue.name, Venue.upcoming_shows_count))
+
+
+class VenueListingTestCase(FyyurTestCase):
+
+    def test_venues_are_grouped_by_city_and_state(self):
+        with self.app.app_context():
+            for name, city, state in (
+                    ('The Musical Hop', 'San Francisco', 'CA'),
+                    ('Park Square', 'San Francisco', 'CA'),
+                    ('The Dueling Pianos', 'New York', 'NY'),
+                    ('Crema', 'Portland', 'OR'),
+                    ('Dock House', 'Portland', 'ME')):
+                add_venue(name, city=city, state=state)
+            db.session.remove()
+
+        res = self.client.get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        areas = []
+        for section in res.get_data(as_text=True).split('<h3>')[1:]:
+            heading, _, items = section.partition('</h3>')
+            areas.append((heading, re.findall(r'<h5>([^<]+)</h5>', items)))
+        self.assertEqual(areas, [
+            ('San Francisco, CA', ['Park Square', 'The Musical Hop']),
+            ('Portland, ME', ['Dock House']),
+            ('New York, NY', ['The Dueling Pianos']),
+            ('Portland, OR', ['Crema'])])
+
+
+class UpcomingShowCountTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(UpcomingShowCountTestCase, self).setUp()
+        with self.app.app_context():
+            self.venue_id = add_venue()
+            self.artist_id = add_artist()
+            db.session.remove()
+
+    def post_show(self, start_time):
+        self.client.post('/shows/create', data={
+            'venue_id': self.venue_id, 'artist_id': self.artist_id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    def test_count_follows_show_create_and_delete(self):
+        now = datetime.now()
+        self.post_show(now + timedelta(days=1))
+        self.post_show(now + timedelta(days=2))
+        self.post_show(now - timedelta(days=1))
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 2})
+
+        with self.app.app_context():
+            shows = [show_id for show_id, in db.session.query(
+                Show.id).order_by(Show.start_time)]
+        self.client.delete('/shows/{}'.format(shows[0]))
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 2})
+        res = self.client.delete('/shows/{}'.format(shows[1]))
+
+        self.assertEqual(res.status_code, 204)
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 1})
+
+    def test_roll_forward_moves_started_shows(self):
+        now = datetime.now()
+        with self.app.app_context():
+            other_venue_id = add_venue('Park Square')
+            for venue_id, minutes in ((self.venue_id, 10),
+                                      (self.venue_id, 30),
+                                      (self.venue_id, 600),
+                                      (other_venue_id, 20)):
+                add_show(venue_id, self.artist_id,
+                         now + timedelta(minutes=minutes))
+            self.assertEqual(upcoming_counts(), {'The Musical Hop': 3,
+                                                 'Park Square': 1})
+
+            updated = fyyur.roll_forward_upcoming_counts(
+                now=now + timedelta(minutes=25))
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 2,
+                                             'Park Square': 0})
+
+    def test_roll_forward_command(self):
+        now = datetime.now()
+        with self.app.app_context():
+            add_show(self.venue_id, self.artist_id, now + timedelta(days=1))
+            # counted as upcoming, then the start time passed
+            Show.query.update({Show.start_time: now - timedelta(hours=3)})
+            db.session.commit()
+        runner = self.app.test_cli_runner()
+
+        windowed = runner.invoke(args=['fyyur', 'roll-forward'])
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 1})
+        full = runner.invoke(args=['fyyur', 'roll-forward', '--full'])
+
+        self.assertEqual(windowed.exit_code, 0)
+        self.assertIn('recounted upcoming shows for 0 venues',
+                      windowed.output)
+        self.assertEqual(full.exit_code, 0)
+        self.assertIn('recounted upcoming shows for 1 venues', full.output)
+        self.assertEqual(upcoming_counts(), {'The Musical Hop': 0})
+
+
+class PastAndUpcomingShowsTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(PastAndUpcomingShowsTestCase, self).setUp()
+        self.now = datetime.now().replace(microsecond=0)
+        with self.app.app_context():
+            self.venue_id = add_venue()
+            self.artist_ids = [add_artist('Artist {:02d}'.format(i))
+                               for i in range(15)]
+            # Artist N played N days before now; Artist 00 exactly at now
+            for i, artist_id in enumerate(self.artist_ids):
+                add_show(self.venue_id, artist_id,
+                         self.now - timedelta(days=i))
+            add_show(self.venue_id, self.artist_ids[0],
+                     self.now + timedelta(hours=1))
+            db.session.remove()
+
+    def split(self, past_page=1, now=None):
+        with self.app.app_context():
+            upcoming, past, count = fyyur.split_shows(
+                Show.venue_id, self.venue_id, Show.artist, past_page,
+                now or self.now)
+            return ([show.artist.name for show in upcoming],
+                    [show.artist.name for show in past], count)
+
+    def test_show_at_now_is_past_and_later_show_upcoming(self):
+        upcoming, past, count = self.split()
+
+        self.assertEqual(upcoming, ['Artist 00'])
+        self.assertEqual(past[0], 'Artist 00')
+        self.assertEqual(count, 15)
+
+        upcoming, past, count = self.split(
+            now=self.now - timedelta(seconds=1))
+
+        self.assertEqual(upcoming, ['Artist 00', 'Artist 00'])
+        self.assertEqual(len(past), 12)
+        self.assertEqual(past[0], 'Artist 01')
+        self.assertEqual(count, 14)
+
+    def test_past_pages(self):
+        per_page = fyyur.PAST_SHOWS_PER_PAGE
+
+        _, first, first_count = self.split(1)
+        _, second, second_count = self.split(2)
+        _, beyond, beyond_count = self.split(3)
+
+        self.assertEqual(first, ['Artist {:02d}'.format(i)
+                                 for i in range(per_page)])
+        self.assertEqual(second, ['Artist {:02d}'.format(i)
+                                  for i in range(per_page, 15)])
+        self.assertEqual((first_count, second_count), (15, 15))
+        self.assertEqual((beyond, beyond_count), ([], 15))
+
+    def test_venue_page_lists_one_page_of_past_shows(self):
+        res = self.client.get('/venues/{}?past_page=2'.format(self.venue_id))
+
+        html = res.get_data(as_text=True)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('>1 Upcoming Show<', html)
+        self.assertIn('>15 Past Shows<', html)
+        self.assertIn('href="?past_page=1">Newer</a>', html)
+        self.assertNotIn('>Older</a>', html)
+        # one upcoming tile plus what is left of the past shows
+        self.assertEqual(html.count('<h6>'),
+                         1 + 15 - fyyur.PAST_SHOWS_PER_PAGE)
+
+    def test_artist_page_counts_past_and_upcoming_shows(self):
+        res = self.client.get('/artists/{}'.format(self.artist_ids[0]))
+
+        html = res.get_data(as_text=True)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('>1 Upcoming Show<', html)
+        self.assertIn('>1 Past Show<', html)
+        self.assertNotIn('past_page=', html)
+
+class BookingTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(BookingTestCase, self).setUp()
+        with self.app.app_context():
+            self.venue_id = add_venue()
+            self.artist_id = add_artist()
+            self.other_artist_id = add_artist('Matt Quevedo')
+            db.session.remove()
+
+    def post_show(self, artist_id, start_time, duration=None):
+        data = {'venue_id': self.venue_id, 'artist_id': artist_id,
+                'start_time': start_time}
+        if duration is not None:
+            data['duration'] = duration
+        return self.client.post('/shows/create', data=data)
+
+    def start_times(self):
+        with self.app.app_context():
+            return sorted(start_time.strftime('%Y-%m-%d %H:%M')
+                          for start_time, in db.session.query(
+                              Show.start_time))
+
+    def test_overlapping_show_is_rejected(self):
+        self.post_show(self.artist_id, '2031-01-01 20:00:00', 120)
+
+        res = self.post_show(self.other_artist_id, '2031-01-01 21:30:00')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'the venue is already booked at that time', res.data)
+        self.assertEqual(self.start_times(), ['2031-01-01 20:00'])
+
+    def test_show_overlapping_the_artist_is_rejected(self):
+        with self.app.app_context():
+            other_venue_id = add_venue('Park Square')
+            add_show(other_venue_id, self.artist_id,
+                     datetime(2031, 1, 1, 19, 0), 90)
+
+        res = self.post_show(self.artist_id, '2031-01-01 20:00:00')
+
+        self.assertIn(b'the artist is already booked at that time', res.data)
+        self.assertEqual(self.start_times(), ['2031-01-01 19:00'])
+
+    def test_adjacent_show_is_accepted(self):
+        self.post_show(self.artist_id, '2031-01-01 20:00:00', 120)
+
+        res = self.post_show(self.other_artist_id, '2031-01-01 22:00:00')
+        earlier = self.post_show(self.other_artist_id,
+                                 '2031-01-01 18:00:00', 120)
+
+        self.assertIn(b'Show was successfully listed!', res.data)
+        self.assertIn(b'Show was successfully listed!', earlier.data)
+        self.assertEqual(self.start_times(), ['2031-01-01 18:00',
+                                              '2031-01-01 20:00',
+                                              '2031-01-01 22:00'])
+
+    def test_400_for_invalid_show_duration(self):
+        res = self.post_show(self.artist_id, '2031-01-01 20:00:00', 0)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.start_times(), [])
+
+    def test_venue_availability(self):
+        self.post_show(self.artist_id, '2031-01-01 20:00:00', 120)
+        self.post_show(self.other_artist_id, '2031-01-02 01:00:00', 60)
+
+        res = self.client.get(
+            '/venues/{}/availability?from=2031-01-01T18:00&to=2031-01-02T02:00'
+            .format(self.venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json(), {
+            'venue_id': self.venue_id,
+            'from': '2031-01-01T18:00:00',
+            'to': '2031-01-02T02:00:00',
+            'booked': [
+                {'start': '2031-01-01T20:00:00', 'end': '2031-01-01T22:00:00'},
+                {'start': '2031-01-02T01:00:00', 'end': '2031-01-02T02:00:00'},
+            ],
+            'free': [
+                {'start': '2031-01-01T18:00:00', 'end': '2031-01-01T20:00:00'},
+                {'start': '2031-01-01T22:00:00', 'end': '2031-01-02T01:00:00'},
+            ],
+        })
+
+    def test_400_and_404_for_venue_availability(self):
+        url = '/venues/{}/availability?from={}&to={}'
+        for venue_id, start, end, status in (
+                (self.venue_id, '2031-01-02', '2031-01-01', 400),
+                (self.venue_id, '2031-01-01', '2031-06-01', 400),
+                (self.venue_id, 'tomorrow', '2031-01-01', 400),
+                (999, '2031-01-01', '2031-01-02', 404)):
+            res = self.client.get(url.format(venue_id, start, end))
+            self.assertEqual(res.status_code, status, (start, end))
+
+
+class HomeFeedTestCase(FyyurTestCase):
+
+    def home_feeds(self):
+        """{heading: names listed under it} of the home page."""
+        res = self.client.get('/')
+        self.assertEqual(res.status_code, 200)
+        feeds = {}
+        for section in res.get_data(as_text=True).split('<h3>')[1:]:
+            heading, _, items = section.partition('</h3>')
+            feeds[heading] = re.findall(r'<h5>([^<]+)</h5>', items)
+        return feeds
+
+    def post_shows(self, venue_id, artist_id, count, first_day=1):
+        start = datetime.now() + timedelta(days=first_day)
+        for day in range(count):
+            self.client.post('/shows/create', data={
+                'venue_id': venue_id, 'artist_id': artist_id,
+                'start_time': (start + timedelta(days=day)).strftime(
+                    '%Y-%m-%d %H:%M:%S')})
+
+    def test_recently_listed_newest_first(self):
+        with self.app.app_context():
+            for i in range(12):
+                add_venue('Venue {:02d}'.format(i))
+            add_artist('Artist 00')
+            db.session.remove()
+        self.home_feeds()
+
+        self.client.post('/venues/create', data={
+            'name': 'Park Square', 'city': 'San Francisco', 'state': 'CA',
+            'address': '34 Whiskey Moore Ave', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/ParkSquare'})
+        self.client.post('/artists/create', data={
+            'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY',
+            'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/mattquevedo'})
+        feeds = self.home_feeds()
+
+        self.assertEqual(feeds['Recently listed venues'], ['Park Square'] + [
+            'Venue {:02d}'.format(i) for i in range(11, 2, -1)])
+        self.assertEqual(feeds['Recently listed artists'],
+                         ['Matt Quevedo', 'Artist 00'])
+
+    def test_trending_venues_by_upcoming_shows(self):
+        with self.app.app_context():
+            venue_ids = [add_venue('Venue {}'.format(i)) for i in range(3)]
+            artist_id = add_artist()
+            db.session.remove()
+        self.post_shows(venue_ids[1], artist_id, 3)
+        self.post_shows(venue_ids[0], artist_id, 1, first_day=10)
+
+        self.assertEqual(self.home_feeds()['Trending venues'],
+                         ['Venue 1', 'Venue 0'])
+
+        self.post_shows(venue_ids[0], artist_id, 3, first_day=20)
+        res = self.client.get('/')
+
+        self.assertEqual(self.home_feeds()['Trending venues'],
+                         ['Venue 0', 'Venue 1'])
+        self.assertIn(b'4 upcoming shows', res.data)
+
+    def test_feeds_reload_after_max_age(self):
+        self.home_feeds()
+        # written behind the app's back, like another worker would
+        with self.app.app_context():
+            add_venue('Park Square')
+            db.session.remove()
+
+        self.assertEqual(self.home_feeds()['Recently listed venues'], [])
+        max_age = fyyur.recent_venues.max_age
+        fyyur.recent_venues.max_age = 0
+        try:
+            self.assertEqual(self.home_feeds()['Recently listed venues'],
+                             ['Park Square'])
+        finally:
+            fyyur.recent_venues.max_age = max_age
+
+
+class EditTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(EditTestCase, self).setUp()
+        with self.app.app_context():
+            self.venue_id = add_venue(genres=('Jazz', 'Folk'),
+                                      facebook_link='https://fb.com/hop')
+            db.session.remove()
+        self.url = '/venues/{}/edit'.format(self.venue_id)
+
+    def form_data(self, **changes):
+        data = {'name': 'The Musical Hop', 'city': 'San Francisco',
+                'state': 'CA', 'address': '1015 Folsom Street',
+                'genres': ['Jazz', 'Folk'],
+                'facebook_link': 'https://fb.com/hop', 'version': 1}
+        data.update(changes)
+        return data
+
+    def venue(self):
+        with self.app.app_context():
+            venue = Venue.query.get(self.venue_id)
+            return venue.name, venue.version, sorted(venue.genres)
+
+    def test_edit_form_is_prefilled(self):
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'value="1015 Folsom Street"', res.data)
+        self.assertIn(b'name="version" value="1"', res.data)
+
+    def test_edit_venue(self):
+        res = self.client.post(self.url, data=self.form_data(
+            name='The Hop', genres=['Blues']))
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(self.venue(), ('The Hop', 2, ['Blues']))
+        res = self.client.get('/venues/{}'.format(self.venue_id))
+        self.assertIn(b'The Hop', res.data)
+
+    def test_409_for_edit_from_a_stale_version(self):
+        self.client.post(self.url, data=self.form_data(name='The Hop'))
+
+        res = self.client.post(self.url, data=self.form_data(
+            name='The Musical Stop'))
+
+        self.assertEqual(res.status_code, 409)
+        self.assertIn(b'changed by someone else', res.data)
+        self.assertIn(b'value="The Hop"', res.data)
+        self.assertEqual(self.venue(), ('The Hop', 2, ['Folk', 'Jazz']))
+
+    def test_400_for_invalid_edit(self):
+        res = self.client.post(self.url, data=self.form_data(
+            name='', facebook_link='not a link'))
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'name: This field is required.', res.data)
+        self.assertIn(b'value="not a link"', res.data)
+        self.assertEqual(self.venue(), ('The Musical Hop', 1,
+                                        ['Folk', 'Jazz']))
+
+    def test_400_for_edit_without_csrf_token(self):
+        self.app.config['WTF_CSRF_ENABLED'] = True
+        try:
+            res = self.client.post(self.url, data=self.form_data(
+                name='The Hop'))
+        finally:
+            self.app.config['WTF_CSRF_ENABLED'] = False
+
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(b'The CSRF token is missing.', res.data)
+        self.assertEqual(self.venue()[:2], ('The Musical Hop', 1))
+
+    def test_400_for_edit_without_version(self):
+        data = self.form_data()
+        del data['version']
+
+        res = self.client.post(self.url, data=data)
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_edit_artist(self):
+        with self.app.app_context():
+            artist_id = add_artist()
+            db.session.remove()
+        url = '/artists/{}/edit'.format(artist_id)
+        data = {'name': 'Guns N Roses', 'city': 'San Francisco',
+                'state': 'CA', 'genres': ['Rock n Roll'],
+                'facebook_link': 'https://fb.com/gnr', 'version': 1}
+
+        res = self.client.post(url, data=data)
+        stale = self.client.post(url, data=dict(data, name='Guns'))
+
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(stale.status_code, 409)
+        with self.app.app_context():
+            artist = Artist.query.get(artist_id)
+            self.assertEqual((artist.name, artist.version),
+                             ('Guns N Roses', 2))
+
+
+class SearchTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(SearchTestCase, self).setUp()
+        with self.app.app_context():
+            add_venue('The Musical Hop')
+            add_venue('Park Square Live Music & Coffee')
+            add_venue('The Dueling Pianos Bar')
+            add_artist('Guns N Petals')
+            add_artist('The Wild Sax Band')
+            add_artist('Matt Quevedo')
+            db.session.remove()
+
+    def search(self, kind, term):
+        res = self.client.post('/{}/search'.format(kind),
+                               data={'search_term': term})
+        self.assertEqual(res.status_code, 200)
+        return re.findall(r'<h5>(.*?)</h5>', unescape(res.get_data(
+            as_text=True)))
+
+    def suggest(self, prefix):
+        res = self.client.get('/search/suggest', query_string={'q': prefix})
+        return [(s['type'], s['name']) for s in res.get_json()['suggestions']]
+
+    def test_search_is_case_insensitive_and_partial(self):
+        self.assertEqual(self.search('venues', 'Hop'), ['The Musical Hop'])
+        self.assertEqual(self.search('venues', 'hop'), ['The Musical Hop'])
+        self.assertEqual(self.search('venues', 'MUSIC'), [
+            'Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(self.search('artists', 'band'),
+                         ['The Wild Sax Band'])
+        self.assertEqual(self.search('artists', 'A'), [
+            'Guns N Petals', 'Matt Quevedo', 'The Wild Sax Band'])
+        # shorter than a trigram, and a LIKE wildcard taken literally
+        self.assertEqual(self.search('artists', 'ax'), ['The Wild Sax Band'])
+        self.assertEqual(self.search('venues', '%'), [])
+
+    def test_suggestions_follow_create_edit_and_delete(self):
+        self.assertEqual(self.suggest('par'),
+                         [('venue', 'Park Square Live Music & Coffee')])
+
+        self.client.post('/artists/create', data={
+            'name': 'Parker Jazz Trio', 'city': 'New York', 'state': 'NY',
+            'genres': ['Jazz'], 'facebook_link': 'https://fb.com/parker'})
+        self.assertEqual(self.suggest('par'), [
+            ('venue', 'Park Square Live Music & Coffee'),
+            ('artist', 'Parker Jazz Trio')])
+
+        with self.app.app_context():
+            venue_id = Venue.query.filter_by(
+                name='Park Square Live Music & Coffee').one().id
+        self.client.post('/venues/{}/edit'.format(venue_id), data={
+            'name': 'Square One', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'genres': ['Jazz'],
+            'facebook_link': 'https://fb.com/square', 'version': 1})
+        self.assertEqual(self.suggest('par'),
+                         [('artist', 'Parker Jazz Trio')])
+        self.assertEqual(self.suggest('one'), [('venue', 'Square One')])
+
+        res = self.client.delete('/venues/{}'.format(venue_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.suggest('one'), [])
+        self.assertEqual(self.suggest('squ'), [])
+
+
+class PageCacheTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(PageCacheTestCase, self).setUp()
+        with self.app.app_context():
+            self.venue_id = add_venue('The Musical Hop')
+            self.artist_id = add_artist('Guns N Petals')
+            db.session.remove()
+
+    def get(self, url):
+        before = self.client.get('/cache/stats').get_json()
+        res = self.client.get(url)
+        after = self.client.get('/cache/stats').get_json()
+        self.assertEqual(res.status_code, 200)
+        hit = after['hits'] - before['hits']
+        miss = after['misses'] - before['misses']
+        return res.get_data(as_text=True), {(1, 0): 'hit',
+                                            (0, 1): 'miss',
+                                            (0, 0): 'bypass'}[hit, miss]
+
+    def test_second_get_is_served_from_the_cache(self):
+        page, outcome = self.get('/venues')
+        self.assertEqual(outcome, 'miss')
+        # written behind the app's back: the cached page does not see it
+        with self.app.app_context():
+            add_venue('Park Square')
+            db.session.remove()
+
+        cached, outcome = self.get('/venues')
+
+        self.assertEqual(outcome, 'hit')
+        self.assertEqual(cached, page)
+        self.assertNotIn('Park Square', cached)
+        self.assertEqual(self.get('/venues?state=CA')[1], 'miss')
+
+    def test_create_clears_only_its_tags(self):
+        self.get('/venues')
+        self.get('/artists')
+
+        self.client.post('/venues/create', data={
+            'name': 'Park Square', 'city': 'San Francisco', 'state': 'CA',
+            'address': '34 Whiskey Moore Ave', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/ParkSquare'})
+        venues, venues_outcome = self.get('/venues')
+        _, artists_outcome = self.get('/artists')
+
+        self.assertEqual(venues_outcome, 'miss')
+        self.assertIn('Park Square', venues)
+        self.assertEqual(artists_outcome, 'hit')
+
+    def test_edit_and_delete_clear_their_tags(self):
+        self.get('/venues')
+        self.get('/artists')
+
+        self.client.post('/artists/{}/edit'.format(self.artist_id), data={
+            'name': 'Guns N Roses', 'city': 'San Francisco', 'state': 'CA',
+            'genres': ['Rock n Roll'], 'facebook_link': 'https://fb.com/gnr',
+            'version': 1}, follow_redirects=True)
+        artists, artists_outcome = self.get('/artists')
+
+        self.assertEqual(artists_outcome, 'miss')
+        self.assertIn('Guns N Roses', artists)
+        self.assertEqual(self.get('/venues')[1], 'hit')
+
+        res = self.client.delete('/venues/{}'.format(self.venue_id))
+        venues, venues_outcome = self.get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(venues_outcome, 'miss')
+        self.assertNotIn('The Musical Hop', venues)
+
+    def test_pending_flash_messages_bypass_the_cache(self):
+        self.get('/venues')
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Venue Park Square listed')]
+
+        flashed, outcome = self.get('/venues')
+
+        self.assertEqual(outcome, 'bypass')
+        self.assertIn('Venue Park Square listed', flashed)
+        page, outcome = self.get('/venues')
+        self.assertEqual(outcome, 'hit')
+        self.assertNotIn('Venue Park Square listed', page)
+
+
+class GenreTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(GenreTestCase, self).setUp()
+        with self.app.app_context():
+            add_venue('The Musical Hop', genres=('Jazz', 'Folk'))
+            add_venue('The Dueling Pianos Bar', genres=('Classical',),
+                      city='New York', state='NY')
+            add_venue('Park Square', genres=('Jazz', 'Rock n Roll'))
+            add_artist('Guns N Petals', genres=('Rock n Roll',))
+            add_artist('Matt Quevedo', genres=('Jazz',))
+            add_artist('The Wild Sax Band', genres=('Jazz', 'Classical'))
+            db.session.remove()
+
+    def names(self, url):
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 200)
+        return set(re.findall(r'<h5>(.*?)</h5>', res.get_data(as_text=True)))
+
+    def test_venues_by_genre(self):
+        self.assertEqual(self.names('/venues?genre=Jazz'),
+                         {'The Musical Hop', 'Park Square'})
+        self.assertEqual(self.names('/venues?genre=Classical'),
+                         {'The Dueling Pianos Bar'})
+        self.assertEqual(self.names('/venues?genre=Jazz&state=NY'), set())
+        self.assertEqual(self.names('/venues?genre=Blues'), set())
+        self.assertEqual(len(self.names('/venues')), 3)
+
+    def test_artists_by_genre(self):
+        self.assertEqual(self.names('/artists?genre=Jazz'),
+                         {'Matt Quevedo', 'The Wild Sax Band'})
+        self.assertEqual(self.names('/artists?genre=Rock n Roll'),
+                         {'Guns N Petals'})
+        self.assertEqual(self.names('/artists?genre=jazz'), set())
+        self.assertEqual(len(self.names('/artists')), 3)
+
+
+class GenreMigrationTestCase(FyyurTestCase):
+    """Round trip of the revision that moved genres into their own
+    tables."""
+
+    revision = 'fc4c393569dd'
+    # the Venue columns before it, with genres still a joined string
+    venues = sa.table('Venue', *(sa.column(name) for name in (
+        'id', 'name', 'city', 'state', 'address', 'seeking_talent',
+        'genres')))
+
+    def venue(self, venue_id, name, genres):
+        return {'id': venue_id, 'name': name, 'city': 'San Francisco',
+                'state': 'CA', 'address': '1015 Folsom Street',
+                'seeking_talent': False, 'genres': genres}
+
+    def test_split_genres_upgrade_and_downgrade(self):
+        previous = self.revision + '-1'
+        try:
+            with self.app.app_context():
+                downgrade(directory=MIGRATIONS_PATH, revision=previous)
+                db.session.execute(self.venues.insert(), [
+                    self.venue(1, 'The Musical Hop', 'Jazz, Folk,Jazz'),
+                    # a PostgreSQL array literal
+                    self.venue(2, 'Park Square', '{Rock n Roll,"R&B"}'),
+                    self.venue(3, 'The Dueling Pianos Bar', None)])
+                db.session.commit()
+
+                upgrade(directory=MIGRATIONS_PATH, revision=self.revision)
+                self.assertEqual(sorted(db.session.execute(
+                    'SELECT venue_id, genre FROM venue_genres')), [
+                    (1, 'Folk'), (1, 'Jazz'),
+                    (2, 'R&B'), (2, 'Rock n Roll')])
+
+                downgrade(directory=MIGRATIONS_PATH, revision=previous)
+                self.assertEqual(list(db.session.execute(
+                    'SELECT id, genres FROM "Venue" ORDER BY id')), [
+                    (1, 'Folk,Jazz'), (2, 'R&B,Rock n Roll'), (3, None)])
+                db.session.remove()
+        finally:
+            with self.app.app_context():
+                db.session.remove()
+                upgrade(directory=MIGRATIONS_PATH)
+        with self.app.app_context():
+            self.assertEqual(sorted(Venue.query.get(1).genres),
+                             ['Folk', 'Jazz'])
+
+
+class ImportTestCase(FyyurTestCase):
+
+    def setUp(self):
+        super(ImportTestCase, self).setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.checkpoint = self.write('import.checkpoint', None)
+        self.venues = self.write('venues.csv', [
+            'id,name,city,state,address,genres,facebook_link',
+            '10,The Musical Hop,San Francisco,CA,1015 Folsom Street,'
+            '"Jazz,Folk",https://fb.com/hop',
+            '11,Park Square,San Francisco,CA,34 Whiskey Moore Ave,Jazz,'
+            'https://fb.com/park'])
+        self.artists = self.write('artists.jsonl', [
+            '{"id": "a1", "name": "Guns N Petals", "city": "San Francisco",'
+            ' "state": "CA", "genres": ["Rock n Roll"],'
+            ' "facebook_link": "https://fb.com/gnp"}'])
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        if lines is not None:
+            with open(path, 'w') as stream:
+                stream.write('\n'.join(lines) + '\n')
+        return path
+
+    def run_import(self, *args, **files):
+        args = ['fyyur', 'import', '--checkpoint', self.checkpoint] + list(
+            args)
+        for kind, path in sorted(files.items()):
+            args.extend(['--' + kind, path])
+        return self.app.test_cli_runner().invoke(args=args)
+
+    def shows(self):
+        with self.app.app_context():
+            return [(show.venue.name, show.artist.name, show.duration_minutes)
+                    for show in Show.query.order_by(Show.start_time)]
+
+    def test_show_durations(self):
+        shows = self.write('shows.csv', [
+            'venue_id,artist_id,start_time,duration',
+            '10,a1,2035-04-01 20:00:00,90',
+            '11,a1,2035-04-02 20:00:00,',
+            '10,a1,2035-04-03 20:00:00,0'])
+
+        result = self.run_import(venues=self.venues, artists=self.artists,
+                                 shows=shows)
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('shows record 4: duration: Number must be between 1',
+                      result.output)
+        self.assertEqual(self.shows(), [])
+
+        result = self.run_import('--skip-invalid', venues=self.venues,
+                                 artists=self.artists, shows=shows)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('imported 2 shows (1 skipped)', result.output)
+        self.assertEqual(self.shows(), [
+            ('The Musical Hop', 'Guns N Petals', 90),
+            ('Park Square', 'Guns N Petals',
+             fyyur.DEFAULT_DURATION_MINUTES)])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+    def test_imports_the_catalogue_by_file_id(self):
+        with self.app.app_context():
+            add_venue('The Dueling Pianos Bar')
+            db.session.remove()
+        shows = self.write('shows.jsonl', [
+            '{"venue_id": 11, "artist_id": "a1",'
+            ' "start_time": "2035-04-01 20:00:00"}',
+            '',
+            '{"venue_id": "10", "artist_id": "a1",'
+            ' "start_time": "2035-04-02T20:00:00", "duration": 45}'])
+
+        result = self.run_import(venues=self.venues, artists=self.artists,
+                                 shows=shows)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('imported 2 venues (0 skipped)', result.output)
+        self.assertEqual(self.shows(), [
+            ('Park Square', 'Guns N Petals', fyyur.DEFAULT_DURATION_MINUTES),
+            ('The Musical Hop', 'Guns N Petals', 45)])
+        with self.app.app_context():
+            venues = {venue.name: (sorted(venue.genres),
+                                   venue.upcoming_shows_count)
+                      for venue in Venue.query}
+            artist = Artist.query.one()
+            self.assertEqual(venues, {
+                'The Dueling Pianos Bar': (['Jazz'], 0),
+                'The Musical Hop': (['Folk', 'Jazz'], 1),
+                'Park Square': (['Jazz'], 1)})
+            self.assertEqual((artist.genres, artist.facebook_link),
+                             (['Rock n Roll'], 'https://fb.com/gnp'))
+
+    def test_records_are_validated_like_the_forms(self):
+        venues = self.write('invalid-venues.csv', [
+            'id,name,city,state,address,genres,facebook_link',
+            '10,The Musical Hop,San Francisco,CA,1015 Folsom Street,Jazz,',
+            '11,,San Francisco,CA,34 Whiskey Moore Ave,Jazz,'
+            'https://fb.com/park',
+            '12,Park Square,San Francisco,XX,34 Whiskey Moore Ave,Jazz,'
+            'https://fb.com/park',
+            '13,Park Square,San Francisco,CA,34 Whiskey Moore Ave,Polka,'
+            'https://fb.com/park',
+            '14,Park Square,San Francisco,CA,34 Whiskey Moore Ave,Jazz,'
+            'https://fb.com/park'])
+        shows = self.write('shows.csv', [
+            'venue_id,artist_id,start_time',
+            '14,a1,2035-04-01 20:00:00',
+            '10,a1,2035-04-02 20:00:00',
+            '14,a2,2035-04-03 20:00:00',
+            '14,a1,not a time'])
+
+        result = self.run_import(venues=venues)
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('venues record 2: facebook_link: Invalid URL.',
+                      result.output)
+        with self.app.app_context():
+            self.assertEqual(Venue.query.count(), 0)
+
+        result = self.run_import('--skip-invalid', venues=venues,
+                                 artists=self.artists, shows=shows)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('imported 1 venues (4 skipped)', result.output)
+        self.assertIn('imported 1 shows (3 skipped)', result.output)
+        self.assertEqual(self.shows(), [
+            ('Park Square', 'Guns N Petals', fyyur.DEFAULT_DURATION_MINUTES)])
+
+    def test_interrupted_import_resumes_from_the_checkpoint(self):
+        lines = ['venue_id,artist_id,start_time',
+                 '10,a1,2035-04-01 20:00:00',
+                 '11,a1,2035-04-02 20:00:00',
+                 '12,a1,2035-04-03 20:00:00',
+                 '10,a1,2035-04-04 20:00:00']
+        shows = self.write('shows.csv', lines)
+
+        result = self.run_import('--batch-size', '1', venues=self.venues,
+                                 artists=self.artists, shows=shows)
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('shows record 4: unknown venue 12', result.output)
+        self.assertEqual(len(self.shows()), 2)
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+        # fixed in place, then the same command again
+        lines[3] = '11,a1,2035-04-03 20:00:00'
+        self.write('shows.csv', lines)
+        result = self.run_import('--batch-size', '1', venues=self.venues,
+                                 artists=self.artists, shows=shows)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('resuming after 5 records', result.output)
+        self.assertIn('imported 0 venues', result.output)
+        self.assertEqual([venue for venue, _, _ in self.shows()], [
+            'The Musical Hop', 'Park Square', 'Park Square',
+            'The Musical Hop'])
+        with self.app.app_context():
+            self.assertEqual(Venue.query.count(), 2)
+            self.assertEqual(Artist.query.count(), 1)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_checkpoint_of_other_files_is_refused(self):
+        shows = self.write('shows.csv', ['venue_id,artist_id,start_time',
+                                         '12,a1,2035-04-01 20:00:00'])
+        self.run_import(venues=self.venues, artists=self.artists,
+                        shows=shows)
+
+        result = self.run_import(venues=self.venues)
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('belongs to an import of other files', result.output)
+
+class TopNTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.scores = {}
+        self.feed = TopN(self.load, size=2, slack=1, max_age=60,
+                         clock=lambda: self.now)
+
+    def load(self, limit):
+        ranked = sorted(((score, key) for key, score in self.scores.items()),
+                        reverse=True)
+        return [(key, score, key) for score, key in ranked[:limit]]
+
+    def test_ties_rank_the_higher_key_first(self):
+        self.scores = {1: 5, 2: 5, 3: 1}
+
+        self.assertEqual(self.feed.items(), [2, 1])
+
+    def test_offer_reranks_without_loading(self):
+        self.scores = {1: 5, 2: 4, 3: 3, 4: 2}
+        self.feed.items()
+
+        self.feed.offer(3, 6, 3)
+
+        self.assertEqual(self.feed.items(), [3, 1])
+        self.assertEqual(self.feed.loads, 1)
+
+    def test_reloads_when_older_than_max_age(self):
+        self.scores = {1: 5, 2: 4}
+        self.assertEqual(self.feed.items(), [1, 2])
+        self.scores[3] = 9
+
+        self.now = 59
+        self.assertEqual(self.feed.items(), [1, 2])
+        self.now = 60
+        self.assertEqual(self.feed.items(), [3, 1])
+        self.assertEqual(self.feed.loads, 2)
+
+    def test_reloads_when_tracked_items_drop_below_the_floor(self):
+        self.scores = {1: 5, 2: 4, 3: 3, 4: 2}
+        self.feed.items()
+
+        self.feed.offer(1, 0, 1)
+        self.feed.offer(2, 0, 2)
+        self.scores.update({1: 0, 2: 0})
+
+        self.assertEqual(self.feed.items(), [3, 4])
+        self.assertEqual(self.feed.loads, 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.entries = [('venue', 1, 'The Musical Hop')]
+        self.loads = 0
+        self.index = PrefixIndex(self.load, max_age=60,
+                                 clock=lambda: self.now)
+
+    def load(self):
+        self.loads += 1
+        return list(self.entries)
+
+    def test_every_word_starts_a_key(self):
+        self.index.suggest('hop')
+        self.index.add('artist', 2, 'Hop Along')
+
+        # key order: "hop" sorts before "hop along"
+        self.assertEqual(self.index.suggest('HO'), [
+            ('venue', 1, 'The Musical Hop'), ('artist', 2, 'Hop Along')])
+        self.assertEqual(self.index.suggest('mus'),
+                         [('venue', 1, 'The Musical Hop')])
+        self.assertEqual(self.index.suggest('along', limit=1),
+                         [('artist', 2, 'Hop Along')])
+        self.assertEqual(self.index.suggest('  '), [])
+
+    def test_rebuilds_from_the_loader_after_max_age(self):
+        self.index.suggest('hop')
+        # changed by another process
+        self.entries = [('venue', 1, 'The Hop Shop')]
+
+        self.now = 59
+        self.assertEqual(self.index.suggest('musical'),
+                         [('venue', 1, 'The Musical Hop')])
+        self.assertEqual(self.loads, 1)
+
+        self.now = 60
+        self.assertEqual(self.index.suggest('musical'), [])
+        self.assertEqual(self.index.suggest('shop'),
+                         [('venue', 1, 'The Hop Shop')])
+        self.assertEqual(self.loads, 2)
+
+
+class DateTimeFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.format_datetime = DateTimeFilter(locale='en')
+        self.values = [datetime(2019, 5, 21, 21, 30),
+                       datetime(2035, 4, 1, 9, 5, 7),
+                       datetime(2019, 12, 31, 0, 0)]
+
+    def babel(self, value, format):
+        # the filter it replaces
+        return babel.dates.format_datetime(value, FORMATS[format],
+                                           locale='en')
+
+    def test_matches_babel_for_datetimes_and_strings(self):
+        for value in self.values:
+            for format in ('full', 'medium'):
+                expected = self.babel(value, format)
+                self.assertEqual(self.format_datetime(value, format),
+                                 expected)
+                self.assertEqual(self.format_datetime(
+                    value.isoformat(), format), expected)
+        self.assertEqual(self.format_datetime(self.values[0]),
+                         self.babel(self.values[0], 'medium'))
+        self.assertEqual(self.format_datetime('2019-05-21T21:30:00.000Z',
+                                              'full'),
+                         'Tuesday May, 21, 2019 at 9:30PM')
+
+    def test_memo_is_per_format(self):
+        value = self.values[0]
+
+        full = self.format_datetime(value, 'full')
+        medium = self.format_datetime(value, 'medium')
+        pattern = self.format_datetime(value, 'yyyy-MM-dd')
+
+        self.assertEqual(full, 'Tuesday May, 21, 2019 at 9:30PM')
+        self.assertEqual(medium, 'Tue 05, 21, 2019 9:30PM')
+        self.assertEqual(pattern, '2019-05-21')
+        self.assertEqual(self.format_datetime(value, 'full'), full)
+        self.assertEqual(self.format_datetime.cache_info().hits, 1)
+
+    def test_format_many(self):
+        values = self.values + [self.values[0], self.values[1].isoformat()]
+
+        self.assertEqual(self.format_datetime.format_many(values, 'full'),
+                         [self.babel(value, 'full') for value in
+                          self.values + self.values[:2]])
+        self.assertEqual(self.format_datetime.format_many(values),
+                         [self.babel(value, 'medium') for value in
+                          self.values + self.values[:2]])
+        self.assertEqual(self.format_datetime.format_many([]), [])
+
+
+def load_production_config(**environ):
+    """config_production as imported with environ, leaving the config
+    modules the app was loaded from in place."""
+    saved = {name: sys.modules.pop(name, None)
+             for name in ('config', 'config_production')}
+    try:
+        with mock.patch.dict(os.environ, environ):
+            return importlib.import_module('config_production')
+    finally:
+        for name, module in saved.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+
+
+GUNICORN_CONF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+
+
+class Launcher(BaseApplication):
+    """Runs gunicorn.conf.py up to the preload, recording the
+    environment the app is imported with."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.preloaded_config = []
+        super(Launcher, self).__init__()
+
+    def load_config(self):
+        for name, value in self.settings.items():
+            if name in self.cfg.settings:
+                self.cfg.set(name, value)
+
+    def load(self):
+        self.preloaded_config.append(os.environ.get('FYYUR_CONFIG'))
+        return fyyur.app
+
+
+class ProductionConfigTestCase(unittest.TestCase):
+
+    def test_refuses_to_start_without_secret_key(self):
+        with self.assertRaisesRegex(RuntimeError, 'SECRET_KEY must be set'):
+            load_production_config(SECRET_KEY='')
+
+        config = load_production_config(SECRET_KEY='shared')
+
+        self.assertEqual(config.SECRET_KEY, 'shared')
+        self.assertFalse(config.DEBUG)
+
+    def test_pool_options_reach_the_engine(self):
+        config = load_production_config(
+            SECRET_KEY='shared', DATABASE_URL='postgresql://db/fyyur',
+            DB_POOL_SIZE='7', DB_POOL_RECYCLE='600')
+        app = Flask('production')
+        app.config.from_object(config)
+
+        with mock.patch('flask_sqlalchemy.sqlalchemy.create_engine') as \
+                create_engine, app.app_context():
+            SQLAlchemy(app).engine
+
+        options = create_engine.call_args[1]
+        self.assertEqual(
+            {name: options[name] for name in config.SQLALCHEMY_ENGINE_OPTIONS},
+            {'pool_size': 7, 'max_overflow': 10, 'pool_timeout': 30,
+             'pool_recycle': 600, 'pool_pre_ping': True})
+        # SQLite keeps the pool Flask-SQLAlchemy picks for it
+        self.assertFalse(hasattr(load_production_config(
+            SECRET_KEY='shared', DATABASE_URL='sqlite:///fyyur.db'),
+            'SQLALCHEMY_ENGINE_OPTIONS'))
+
+    def gunicorn_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(GUNICORN_CONF)
+
+    def test_app_is_preloaded_with_the_production_config(self):
+        settings = self.gunicorn_settings()
+        self.assertTrue(settings['preload_app'])
+
+        with mock.patch.dict(os.environ):
+            os.environ.pop('FYYUR_CONFIG', None)
+            launcher = Launcher(settings)
+            Arbiter(launcher)
+
+        # raw_env is exported before the master imports the app
+        self.assertEqual(launcher.preloaded_config, ['production'])
+
+    def test_sqlite_gets_a_single_worker(self):
+        self.assertEqual(self.gunicorn_settings(
+            DATABASE_URL='postgresql://db/fyyur',
+            WEB_CONCURRENCY='4')['workers'], 4)
+        self.assertEqual(self.gunicorn_settings(
+            DATABASE_URL='sqlite:///fyyur.db',
+            WEB_CONCURRENCY='4')['workers'], 1)
+
+    def test_fork_hooks_reset_per_process_state(self):
+        settings = self.gunicorn_settings()
+        queued_logging = mock.Mock()
+
+        with mock.patch.object(fyyur.db.engine, 'dispose') as dispose, \
+                mock.patch.object(fyyur, 'queued_logging', queued_logging):
+            settings['pre_fork'](None, None)
+            self.assertEqual(dispose.call_count, 1)
+            queued_logging.after_fork.assert_not_called()
+
+            settings['post_fork'](None, None)
+            self.assertEqual(dispose.call_count, 2)
+            queued_logging.after_fork.assert_called_once_with()
@@ -0,0 +1,10 @@
+from app import app
+
+'''
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+'''
+
+if __name__ == '__main__':
+    app.run()
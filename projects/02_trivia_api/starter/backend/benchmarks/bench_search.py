@@ -0,0 +1,97 @@
+'''
+Compares the ILIKE scan with the full-text search engine used by
+POST /questions/search on a generated bank of questions.
+
+    cd backend
+    python -m benchmarks.bench_search [--questions 100000] [--database URL]
+
+Without --database a temporary SQLite file is used (FTS5 engine).
+Pass a PostgreSQL URL to benchmark the tsvector/GIN engine instead.
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import Flask
+from flask_migrate import upgrade
+
+from models import setup_db, db, Question, Category
+from flaskr.search import LikeSearchEngine, create_search_engine
+
+MIGRATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+COMMON_WORDS = ('which', 'what', 'who', 'the', 'is', 'of', 'in')
+TERMS = ('lake', 'pal', 'ancient king', 'medicine', 'Ubiquitious', 'wor')
+ROUNDS = 20
+
+
+def vocabulary(rng, size=20000):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = {''.join(rng.choice(letters) for _ in range(rng.randint(4, 9)))
+             for _ in range(size)}
+    return sorted(words) + ['lake', 'palace', 'ancient', 'king',
+                            'medicine', 'world']
+
+
+def populate(count, batch_size=10000):
+    categories = [Category(type='Category {}'.format(i)) for i in range(6)]
+    db.session.add_all(categories)
+    db.session.commit()
+    category_ids = [category.id for category in categories]
+    rng = random.Random(0)
+    words = vocabulary(rng)
+    for start in range(0, count, batch_size):
+        db.session.execute(Question.__table__.insert(), [{
+            'question': ' '.join([rng.choice(COMMON_WORDS)] + [
+                rng.choice(words) for _ in range(7)]) + '?',
+            'answer': ' '.join(rng.choice(words) for _ in range(2)),
+            'category': rng.choice(category_ids),
+            'difficulty': rng.randint(1, 5)}
+            for _ in range(min(batch_size, count - start))])
+        db.session.commit()
+
+
+def measure(engine):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for term in TERMS:
+            engine.search(term, 1, 10)
+    return (time.perf_counter() - started) / (ROUNDS * len(TERMS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--database')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_path = args.database or 'sqlite:///' + os.path.join(
+        directory, 'bench_search.db')
+    app = Flask(__name__)
+    setup_db(app, database_path)
+    with app.app_context():
+        started = time.perf_counter()
+        populate(args.questions)
+        print('populated {} questions in {:.1f}s'.format(
+            args.questions, time.perf_counter() - started))
+        started = time.perf_counter()
+        upgrade(directory=MIGRATIONS_PATH)
+        engine = create_search_engine(db)
+        print('migrated, {} index built in {:.1f}s'.format(
+            engine.name, time.perf_counter() - started))
+
+        like = measure(LikeSearchEngine(db))
+        indexed = measure(engine)
+        print('{:<12} {:>10.2f} ms/search'.format('ilike', like * 1000))
+        print('{:<12} {:>10.2f} ms/search'.format(engine.name, indexed * 1000))
+        print('speedup      {:>10.1f}x'.format(like / indexed))
+        if args.database:
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
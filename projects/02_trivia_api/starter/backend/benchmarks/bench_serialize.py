@@ -0,0 +1,119 @@
+'''
+Requests/sec of the question listings before and after the
+column-projected serialization path.
+
+    cd backend
+    python -m benchmarks.bench_serialize [--questions 20000] [--encoder json]
+
+"before" is the old implementation (full ORM instances, Question.format()
+per row, jsonify) registered on the same app, "after" the current
+endpoints. Uses a temporary SQLite file unless --database is given.
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from flask import jsonify
+
+from models import db, Question, Category
+from flaskr import create_app
+
+SECONDS = 3.0
+
+
+def populate(count, batch_size=10000):
+    category = Category(type='Science')
+    db.session.add(category)
+    db.session.commit()
+    rng = random.Random(0)
+    for start in range(0, count, batch_size):
+        db.session.execute(Question.__table__.insert(), [{
+            'question': 'Question number {} about {}?'.format(
+                start + i, rng.random()),
+            'answer': 'Answer {}'.format(start + i),
+            'category': category.id,
+            'difficulty': rng.randint(1, 5)}
+            for i in range(min(batch_size, count - start))])
+        db.session.commit()
+    return category.id
+
+
+def register_legacy_routes(app):
+    @app.route('/legacy/categories/<int:category_id>/questions')
+    def legacy_category_questions(category_id):
+        category = Category.query.get(category_id)
+        selection = Question.query.filter_by(category=category_id).all()
+        return jsonify({'success': 'True',
+                        'questions': [question.format()
+                                      for question in selection],
+                        'total_questions': len(selection),
+                        'current_category': category.type})
+
+    @app.route('/legacy/questions')
+    def legacy_questions():
+        selection = Question.query.order_by(Question.id).limit(10).all()
+        categories = Category.query.all()
+        return jsonify({'success': 'True',
+                        'questions': [question.format()
+                                      for question in selection],
+                        'total_questions': Question.query.count(),
+                        'categories': [category.format()
+                                       for category in categories],
+                        'current_category': None})
+
+
+def requests_per_second(client, url):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < SECONDS:
+        response = client.get(url)
+        response.get_data()
+        assert response.status_code == 200, url
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=20000)
+    parser.add_argument('--encoder', choices=('orjson', 'ujson', 'json'))
+    parser.add_argument('--database')
+    args = parser.parse_args()
+
+    database_path = args.database or 'sqlite:///' + os.path.join(
+        tempfile.mkdtemp(), 'bench_serialize.db')
+    config = {'SQLALCHEMY_DATABASE_URI': database_path}
+    if args.encoder:
+        config['TRIVIA_JSON_ENCODER'] = args.encoder
+    app = create_app(config)
+    register_legacy_routes(app)
+    with app.app_context():
+        category_id = populate(args.questions)
+    client = app.test_client()
+
+    cases = (
+        ('category listing',
+         '/legacy/categories/{}/questions'.format(category_id),
+         '/categories/{}/questions'.format(category_id)),
+        ('category listing (stream)',
+         '/legacy/categories/{}/questions'.format(category_id),
+         '/categories/{}/questions?stream=true'.format(category_id)),
+        ('questions page', '/legacy/questions', '/questions'),
+    )
+    print('{} questions in one category'.format(args.questions))
+    print('{:<28} {:>10} {:>10} {:>8}'.format(
+        'endpoint', 'before', 'after', 'speedup'))
+    for name, before_url, after_url in cases:
+        before = requests_per_second(client, before_url)
+        after = requests_per_second(client, after_url)
+        print('{:<28} {:>8.1f}/s {:>8.1f}/s {:>7.1f}x'.format(
+            name, before, after, after / before))
+    if args.database:
+        with app.app_context():
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
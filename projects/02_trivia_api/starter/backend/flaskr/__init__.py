@@ -1,13 +1,23 @@
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy import func
 import random
 import sys
 
-from models import setup_db, Question, Category
+from models import setup_db, db, database_path, Question, Category
+from .bulk import trivia_cli, validate_question, insert_rows_returning_ids
+from .cache import CategoryCache, QuestionCountCache, QuestionStatsCache
+from .difficulty import DifficultyIndex
+from .quiz import QuizSessionStore
+from .search import LazySearchEngine
+from .serialize import STREAM_BATCH_SIZE, format_rows, json_response, \
+    question_rows, select_json_encoder, stream_questions
 
 QUESTIONS_PER_PAGE = 10
+QUESTIONS_PER_BATCH = 1000
 
 '''
 Initial method to set up the application
@@ -17,7 +27,20 @@ Initial method to set up the application
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('SQLALCHEMY_DATABASE_URI', database_path))
+
+    '''
+    JSON encoder for the question listings: orjson or ujson when
+    installed, the stdlib otherwise. TRIVIA_JSON_ENCODER pins one.
+    '''
+    dumps = select_json_encoder(app.config.get('TRIVIA_JSON_ENCODER'))
+
+    '''
+    flask trivia import/export commands.
+    '''
+    app.cli.add_command(trivia_cli)
     '''
     Setting up CORS. Allowing '*' for origins.
     '''
@@ -35,54 +58,112 @@ def create_app(test_config=None):
         return response
 
     '''
-    Helper meethod for paginating questions
+    Cached total of questions, invalidated by the handlers
+    that insert or delete questions.
+    '''
+    question_count = QuestionCountCache()
+
+    '''
+    Formatted categories served from memory. Anything that writes
+    to the categories table must call app.category_cache.invalidate().
+    '''
+    category_cache = CategoryCache(
+        lambda: [category.format()
+                 for category in Category.query.order_by(Category.id)])
+    app.category_cache = category_cache
+
+    '''
+    Question ids by (category, difficulty) for adaptive quizzes.
+    Updated by the handlers that insert or delete questions and
+    rebuilt from the table every ttl seconds.
+    '''
+    difficulty_index = DifficultyIndex(
+        lambda: db.session.query(
+            Question.id, Question.category, Question.difficulty).all())
+    app.difficulty_index = difficulty_index
+
+    '''
+    Question counts per (category, difficulty) for GET /stats.
+    '''
+    question_stats = QuestionStatsCache(
+        lambda: db.session.query(
+            Question.category, Question.difficulty,
+            func.count(Question.id)).group_by(
+            Question.category, Question.difficulty).all())
+
+    '''
+    Drops every in-process cache.
+    Used after writes that bypass the handlers, such as seeding or
+    migrating a database or rolling back a test transaction.
+    '''
+    def reset_caches():
+        search_engine.reset()
+        question_count.invalidate()
+        question_stats.invalidate()
+        category_cache.invalidate()
+        difficulty_index.invalidate()
+    app.reset_caches = reset_caches
+
+    '''
+    Helper method for paginating questions.
+    Pagination is done by the database: with ?after_id=<id> it
+    seeks past the given id (keyset cursor, cheap for deep pages),
+    otherwise ?page=<n> is translated into LIMIT/OFFSET.
+    Only the returned columns are selected.
     '''
-    def paginate_questions(selection, request):
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-        formatted_questions = [question.format() for question in selection]
-        return formatted_questions[start:end]
+    def paginate_questions(query, request):
+        query = query.order_by(Question.id)
+        after_id = request.args.get('after_id', type=int)
+        if after_id is not None:
+            query = query.filter(Question.id > after_id)
+        else:
+            page = request.args.get('page', 1, type=int)
+            if page < 1:
+                return []
+            query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+        return format_rows(query.limit(QUESTIONS_PER_PAGE))
 
     '''
     Endpoint to handle GET requests for questions,
     including pagination (every 10 questions).
     This endpoint should return a list of questions,
     number of total questions, current category, categories.
+    Deep pages can be fetched with ?after_id=<next_after_id>.
     '''
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        questions = Question.query.all()
-        questions_on_page = paginate_questions(questions, request)
-        categories = Category.query.all()
+        questions_on_page = paginate_questions(question_rows(db), request)
+        categories = category_cache.get().categories
         if((len(questions_on_page) == 0) or (len(categories) == 0)):
             abort(404)
         else:
-            return jsonify({'success': 'True',
-                            'questions': questions_on_page,
-                            'total_questions': len(questions),
-                            'categories':
-                            [category.format() for category in categories],
-                            'current_category': None})
+            return json_response(dumps, {
+                'success': 'True',
+                'questions': questions_on_page,
+                'total_questions': question_count.get(Question.query.count),
+                'next_after_id': questions_on_page[-1]['id'],
+                'categories': categories,
+                'current_category': None})
 
     '''
     Endpoint to handle GET requests
     for all available categories.
     This endpoint should return list of categories
     and not of categories
+    Served from the category cache with an ETag, so clients
+    sending If-None-Match get a 304 while nothing changed.
     '''
     @app.route('/categories', methods=['GET'])
     def get_catgories():
-        categories = Category.query.all()
-        if(len(categories) == 0):
+        snapshot = category_cache.get()
+        if(len(snapshot.categories) == 0):
             abort(404)
         else:
-            categories_dict = {}
-            for category in categories:
-                categories_dict[category.id] = category.type
-            return jsonify({'success': 'True',
-                            'categories': categories_dict,
-                            'total_categories': len(categories)})
+            response = jsonify({'success': 'True',
+                                'categories': snapshot.types,
+                                'total_categories': len(snapshot.categories)})
+            response.set_etag(snapshot.etag)
+            return response.make_conditional(request)
 
     '''
     Endpoint to DELETE question using a question ID.
@@ -97,6 +178,10 @@ def create_app(test_config=None):
         else:
             try:
                 question.delete()
+                question_count.invalidate()
+                difficulty_index.remove(question.id, question.category,
+                                        question.difficulty)
+                question_stats.remove(question.category, question.difficulty)
                 return jsonify({'success': 'True',
                                 'question': question.format()})
             except Exception as e:
@@ -116,9 +201,13 @@ def create_app(test_config=None):
         try:
             question = Question(question=data['question'],
                                 answer=data['answer'],
-                                category=data['category'],
-                                difficulty=data['difficulty'])
+                                category=int(data['category']),
+                                difficulty=int(data['difficulty']))
             question.insert()
+            question_count.invalidate()
+            difficulty_index.add(question.id, question.category,
+                                 question.difficulty)
+            question_stats.add(question.category, question.difficulty)
             return jsonify({'success': 'True',
                             'created': question.id
                             })
@@ -126,49 +215,181 @@ def create_app(test_config=None):
             print(sys.exc_info())
             abort(422)
     '''
+    Endpoint to POST many questions at once.
+    Takes {"questions": [...]} with the same fields as POST /questions
+    (at most 1000). All questions are validated first and inserted in a
+    single transaction: either all of them are created or none is.
+    The ids the insert returns are added to the difficulty index.
+    On success, it returns the number of created questions.
+    '''
+    @app.route('/questions/batch', methods=['POST'])
+    def question_batch_submission():
+        data = request.get_json()
+        questions = data.get('questions') if isinstance(data, dict) else None
+        if(not isinstance(questions, list) or len(questions) == 0 or
+           len(questions) > QUESTIONS_PER_BATCH):
+            abort(422)
+        category_ids = set(category_cache.get().types)
+        try:
+            rows = [validate_question(question, category_ids)
+                    for question in questions]
+        except ValueError:
+            abort(422)
+        try:
+            question_ids = insert_rows_returning_ids(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(sys.exc_info())
+            abort(422)
+        question_count.invalidate()
+        for question_id, row in zip(question_ids, rows):
+            difficulty_index.add(question_id, row['category'],
+                                 row['difficulty'])
+            question_stats.add(row['category'], row['difficulty'])
+        return jsonify({'success': 'True',
+                        'total_created': len(rows)})
+
+    '''
+    Endpoint to GET statistics of the question bank.
+    On success, it returns the number of questions in total,
+    per category id (including empty categories), per difficulty
+    and per category id and difficulty.
+    Counts come from a cached GROUP BY kept up to date by the
+    handlers that insert and delete questions.
+    '''
+    @app.route('/stats', methods=['GET'])
+    def get_stats():
+        counts = question_stats.get()
+        categories = {str(category_id): 0
+                      for category_id in category_cache.get().types}
+        difficulties = {}
+        by_category = {}
+        for (category, difficulty), count in counts.items():
+            category, difficulty = str(category), str(difficulty)
+            categories[category] = categories.get(category, 0) + count
+            difficulties[difficulty] = difficulties.get(difficulty, 0) + count
+            by_category.setdefault(category, {})[difficulty] = count
+        return json_response(dumps, {
+            'success': 'True',
+            'total_questions': sum(counts.values()),
+            'categories': categories,
+            'difficulties': difficulties,
+            'categories_by_difficulty': by_category})
+
+    '''
     Endpoint to get questions based on category.
     On success, it returns list of questions under passed
     category, no of total questions and current category.
+    With ?stream=true the JSON is streamed row by row from a
+    server-side cursor instead of being built in memory.
     '''
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def question_search_category(category_id):
-        category = Category.query.filter(
-            Category.id == category_id).one_or_none()
-        if(category is None):
+        category_type = category_cache.get().types.get(category_id)
+        if(category_type is None):
             abort(404)
-        else:
-            selection = Question.query.filter_by(
-                category=str(category_id)).all()
-            if(len(selection) == 0):
+        selection = question_rows(db).filter(
+            Question.category == category_id).order_by(Question.id)
+        if request.args.get('stream', 'false').lower() in ('1', 'true'):
+            rows = iter(selection.yield_per(STREAM_BATCH_SIZE))
+            first_row = next(rows, None)
+            if(first_row is None):
                 abort(404)
-            else:
-                formatted_questions = [question.format()
-                                       for question in selection]
-                return jsonify({'success': 'True',
-                                'questions': formatted_questions,
-                                'total_questions': len(formatted_questions),
-                                'current_category': category.type})
+            return Response(stream_with_context(stream_questions(
+                dumps, {'success': 'True',
+                        'current_category': category_type},
+                first_row, rows)), mimetype='application/json')
+        formatted_questions = format_rows(selection)
+        if(len(formatted_questions) == 0):
+            abort(404)
+        else:
+            return json_response(dumps, {
+                'success': 'True',
+                'questions': formatted_questions,
+                'total_questions': len(formatted_questions),
+                'current_category': category_type})
+
+    '''
+    Full-text search engine for the index the migrations created
+    (tsvector + GIN on PostgreSQL, FTS5 on SQLite), picked on the
+    first search.
+    '''
+    search_engine = LazySearchEngine(db)
+
     '''
     POST endpoint to get questions based on a search term.
-    It should return any questions for whom the search term
-    is a substring of the question.
-    On success, it returns list of questions having that passed
-    search term, no of such questions.
+    It should return any questions whose question or answer text
+    contains words starting with the words of the search term.
+    On success, it returns one page (every 10 questions, "page" in
+    the body, default 1) of matching questions ranked by relevance,
+    and the number of all such questions.
     '''
     @app.route('/questions/search', methods=['POST'])
     def question_search():
         data = request.get_json()
         search_term = data.get('searchTerm', '')
-        selection = Question.query.filter(
-            Question.question.ilike('%{}%'.format(search_term))).all()
+        page = data.get('page', request.args.get('page', 1, type=int))
+        # bool is an int subclass, so page: true would be page 1
+        if(not isinstance(page, int) or isinstance(page, bool) or
+           page < 1):
+            abort(400)
+        selection, total_questions = search_engine.search(
+            search_term, page, QUESTIONS_PER_PAGE)
         if(len(selection) == 0):
             abort(404)
         else:
-            formatted_questions = [question.format() for question in selection]
-            return jsonify({'success': 'True',
-                            'questions': formatted_questions,
-                            'total_questions': len(selection),
-                            'current_category': None})
+            return json_response(dumps, {
+                'success': 'True',
+                'questions': format_rows(selection),
+                'total_questions': total_questions,
+                'current_category': None})
+
+    '''
+    Quiz sessions handed out by POST /quizzes when the client
+    asks for one.
+    '''
+    quiz_sessions = QuizSessionStore()
+
+    '''
+    Helper method that pops ids off a quiz session's deck until
+    it finds a question that still exists.
+    Returns None once the deck is exhausted.
+    '''
+    def draw_from_quiz_session(token):
+        while True:
+            question_id = quiz_sessions.draw(token)
+            if question_id is None:
+                quiz_sessions.discard(token)
+                return None
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+
+    '''
+    Helper method for the adaptive quiz mode. Picks ids from the
+    difficulty index; an id whose row has been deleted meanwhile
+    (e.g. by another worker) is dropped from the index and another
+    one is picked.
+    '''
+    def adaptive_quiz(category_id, target_difficulty, previous_questions):
+        try:
+            target_difficulty = int(target_difficulty)
+        except (TypeError, ValueError):
+            abort(422)
+        if(difficulty_index.count(category_id) == 0):
+            abort(404)
+        while True:
+            question_id = difficulty_index.pick(
+                category_id, target_difficulty, previous_questions)
+            if question_id is None:
+                return jsonify({'success': 'False',
+                                'question': False})
+            question = Question.query.get(question_id)
+            if question is not None:
+                return jsonify({'success': 'True',
+                                'question': question.format()})
+            previous_questions.add(question_id)
 
     '''
     POST endpoint to get questions to play the quiz.
@@ -176,18 +397,66 @@ def create_app(test_config=None):
     and return a random questions within the given category,
     if provided, and that is not one of the previous questions.
     On success, it returns a random question.
+    Sending "quiz_session": true starts a server-side session: the
+    category is shuffled once and the response carries a token.
+    Sending that token back as "quiz_session" draws the next question
+    in constant time, without resending previous_questions.
+    Sending "target_difficulty" serves a question whose difficulty is
+    as close as possible to it, picked from the difficulty index.
     '''
     @app.route('/quizzes', methods=['POST'])
     def quiz():
         data = request.get_json()
-        previous_questions = data['previous_questions']
+        session_token = data.get('quiz_session')
+        if isinstance(session_token, str):
+            try:
+                question = draw_from_quiz_session(session_token)
+            except KeyError:
+                abort(404)
+            if question is None:
+                return jsonify({'success': 'False',
+                                'question': False})
+            return jsonify({'success': 'True',
+                            'question': question.format(),
+                            'quiz_session': session_token})
+
         quiz_category = data['quiz_category']
         category_type = quiz_category.get('type')
+        try:
+            category_id = int(quiz_category.get('id', 0))
+        except (TypeError, ValueError):
+            abort(422)
+        if data.get('target_difficulty') is not None:
+            return adaptive_quiz(
+                None if category_type == 'click' else category_id,
+                data['target_difficulty'],
+                set(data.get('previous_questions', [])))
+        if session_token is True:
+            selection = db.session.query(Question.id)
+            if(category_type != 'click'):
+                selection = selection.filter(
+                    Question.category == category_id)
+            question_ids = [question_id for (question_id,) in selection]
+            if(len(question_ids) == 0):
+                abort(404)
+            previous = set(data.get('previous_questions', []))
+            session_token = quiz_sessions.create(
+                [question_id for question_id in question_ids
+                 if question_id not in previous])
+            question = draw_from_quiz_session(session_token)
+            if question is None:
+                return jsonify({'success': 'False',
+                                'question': False})
+            return jsonify({'success': 'True',
+                            'question': question.format(),
+                            'quiz_session': session_token})
+
+        previous_questions = data['previous_questions']
         if(category_type == 'click'):
             selection = Question.query.all()
         else:
-            selection = Question.query.filter_by(
-                category=str(quiz_category['id'])).all()
+            selection = Question.query.filter(
+                Question.category == category_id).all()
         if(len(selection) == 0):
             abort(404)
         else:
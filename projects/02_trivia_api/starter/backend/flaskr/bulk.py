@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import os
+import time
+
+import click
+from flask.cli import AppGroup, with_appcontext
+
+from models import db, Question, Category
+from .serialize import QUESTION_FIELDS, STREAM_BATCH_SIZE, question_rows
+
+'''
+Bulk import/export of the question bank.
+
+    flask trivia import questions.jsonl [--batch-size 5000]
+    flask trivia export questions.csv
+
+Files are streamed one record at a time in JSON Lines or CSV format
+(picked from the file extension or --format). Imported records are
+validated against the categories loaded once up front and inserted
+in batches: COPY on PostgreSQL, executemany everywhere else.
+'''
+
+IMPORT_FIELDS = ('question', 'answer', 'category', 'difficulty')
+FORMATS = ('jsonl', 'csv')
+DEFAULT_BATCH_SIZE = 5000
+
+
+def validate_question(record, category_ids):
+    '''
+    Returns the insertable row for a question record, or raises
+    ValueError describing what is wrong with it.
+    '''
+    if not isinstance(record, dict):
+        raise ValueError('question must be an object')
+    for field in ('question', 'answer'):
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError('{} is required'.format(field))
+    try:
+        category = int(record.get('category'))
+        difficulty = int(record.get('difficulty'))
+    except (TypeError, ValueError):
+        raise ValueError('category and difficulty must be integers')
+    if category not in category_ids:
+        raise ValueError('unknown category {}'.format(category))
+    return {'question': record['question'],
+            'answer': record['answer'],
+            'category': category,
+            'difficulty': difficulty}
+
+
+def load_category_ids():
+    return {category_id for (category_id,) in db.session.query(Category.id)}
+
+
+def detect_format(path, file_format):
+    if file_format is not None:
+        return file_format
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.json', '.ndjson'):
+        return 'jsonl'
+    raise click.BadParameter(
+        'cannot tell the format of {}, pass --format'.format(path))
+
+
+def read_records(stream, file_format):
+    '''
+    Yields (line number, record) pairs from a JSON Lines or CSV stream.
+    '''
+    if file_format == 'csv':
+        for record in csv.DictReader(stream):
+            yield getattr(stream, 'line_number', None), record
+        return
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                raise ValueError('line {}: {}'.format(line_number, e))
+
+
+def copy_rows(rows):
+    '''
+    Inserts rows with PostgreSQL COPY through the session's
+    connection, so it joins the current transaction.
+    '''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[field] for field in IMPORT_FIELDS])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY questions ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                ', '.join(IMPORT_FIELDS)), buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(rows, use_copy=False):
+    if not rows:
+        return
+    if use_copy:
+        copy_rows(rows)
+    else:
+        db.session.execute(Question.__table__.insert(), rows)
+
+
+def insert_rows_returning_ids(rows):
+    '''
+    Inserts the rows and returns their new ids, in order: one
+    INSERT ... RETURNING on PostgreSQL, one INSERT per row elsewhere
+    (executemany does not report the ids it generated).
+    '''
+    table = Question.__table__
+    if db.engine.dialect.name == 'postgresql':
+        return [question_id for (question_id,) in db.session.execute(
+            table.insert().values(rows).returning(table.c.id))]
+    return [db.session.execute(table.insert(), row).inserted_primary_key[0]
+            for row in rows]
+
+
+def import_questions(records, batch_size=DEFAULT_BATCH_SIZE, use_copy=None,
+                     skip_invalid=False, category_ids=None):
+    '''
+    Validates and inserts (line number, record) pairs, committing
+    every batch_size rows. Returns (inserted, skipped).
+    '''
+    if category_ids is None:
+        category_ids = load_category_ids()
+    if use_copy is None:
+        use_copy = db.engine.dialect.name == 'postgresql'
+    inserted = skipped = 0
+    batch = []
+    for line_number, record in records:
+        try:
+            batch.append(validate_question(record, category_ids))
+        except ValueError as e:
+            if not skip_invalid:
+                raise ValueError('record {}: {}'.format(line_number, e))
+            skipped += 1
+            continue
+        if len(batch) >= batch_size:
+            insert_rows(batch, use_copy)
+            db.session.commit()
+            inserted += len(batch)
+            batch = []
+    insert_rows(batch, use_copy)
+    db.session.commit()
+    inserted += len(batch)
+    return inserted, skipped
+
+
+def export_questions(stream, file_format):
+    '''
+    Writes every question to the stream, reading them from a
+    server-side cursor. Returns the number of rows written.
+    '''
+    rows = question_rows(db).order_by(Question.id).yield_per(
+        STREAM_BATCH_SIZE)
+    count = 0
+    if file_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(QUESTION_FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        stream.write(json.dumps(dict(zip(QUESTION_FIELDS, row))) + '\n')
+        count += 1
+    return count
+
+
+class LineCountingReader(object):
+    '''
+    Wraps a text stream to remember the current line number,
+    which csv.DictReader does not expose per record.
+    '''
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.line_number = 0
+
+    def __iter__(self):
+        for line in self._stream:
+            self.line_number += 1
+            yield line
+
+
+trivia_cli = AppGroup('trivia', help='Bulk operations on the question bank.')
+
+
+@trivia_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS))
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--copy/--no-copy', 'use_copy', default=None,
+              help='Use COPY (default on PostgreSQL).')
+@click.option('--skip-invalid', is_flag=True,
+              help='Skip invalid records instead of stopping.')
+@with_appcontext
+def import_command(path, file_format, batch_size, use_copy, skip_invalid):
+    '''Import questions from a JSON Lines or CSV file.'''
+    file_format = detect_format(path, file_format)
+    started = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as stream:
+        reader = LineCountingReader(stream)
+        try:
+            inserted, skipped = import_questions(
+                read_records(reader, file_format), batch_size=batch_size,
+                use_copy=use_copy, skip_invalid=skip_invalid)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - started
+    click.echo('imported {} questions ({} skipped) in {:.2f}s, '
+               '{:.0f} rows/sec'.format(inserted, skipped, elapsed,
+                                        inserted / elapsed if elapsed else 0))
+
+
+@trivia_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'file_format', type=click.Choice(FORMATS))
+@with_appcontext
+def export_command(path, file_format):
+    '''Export all questions to a JSON Lines or CSV file.'''
+    file_format = detect_format(path, file_format)
+    started = time.perf_counter()
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        count = export_questions(stream, file_format)
+    elapsed = time.perf_counter() - started
+    click.echo('exported {} questions in {:.2f}s, {:.0f} rows/sec'.format(
+        count, elapsed, count / elapsed if elapsed else 0))
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+
+'''
+In-process caches shared by the trivia endpoints.
+'''
+
+
+class QuestionCountCache(object):
+    '''
+    Holds the total number of questions so listing endpoints do not
+    have to COUNT(*) the questions table on every request.
+    Any handler that inserts or deletes questions must call
+    invalidate() once its transaction has been committed. Writes
+    made by other processes (other workers, flask trivia import)
+    show up once the count is older than ttl seconds.
+    '''
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._count = None
+        self._expires_at = 0
+
+    def get(self, loader):
+        count = self._count
+        if count is None or time.monotonic() >= self._expires_at:
+            with self._lock:
+                if self._count is None or \
+                        time.monotonic() >= self._expires_at:
+                    self._count = loader()
+                    self._expires_at = time.monotonic() + self.ttl
+                count = self._count
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._count = None
+
+
+CategorySnapshot = namedtuple(
+    'CategorySnapshot', ['version', 'categories', 'types', 'etag'])
+
+
+class CategoryCache(object):
+    '''
+    Holds the formatted category list and the id -> type dict.
+    Categories almost never change, so they are loaded once and
+    served from memory until invalidate() is called; every reload
+    bumps the version. The ETag is a hash of the content, so all
+    worker processes hand out the same one for the same data.
+    '''
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._load()
+                snapshot = self._snapshot
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _load(self):
+        categories = self._loader()
+        self._version += 1
+        content = json.dumps(categories, sort_keys=True).encode('utf-8')
+        return CategorySnapshot(
+            version=self._version,
+            categories=categories,
+            types={category['id']: category['type']
+                   for category in categories},
+            etag='categories-' + hashlib.sha1(content).hexdigest())
+
+
+class QuestionStatsCache(object):
+    '''
+    Question counts per (category, difficulty), loaded with a single
+    GROUP BY and then adjusted in place by the handlers that insert or
+    delete questions, so reading the statistics costs O(categories)
+    instead of O(questions). Like QuestionCountCache it reloads after
+    ttl seconds to pick up writes made by other processes.
+    '''
+
+    def __init__(self, loader, ttl=300):
+        self.ttl = ttl
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._counts = None
+        self._expires_at = 0
+
+    def get(self):
+        '''
+        Returns {(category, difficulty): count}.
+        '''
+        with self._lock:
+            if self._counts is None or time.monotonic() >= self._expires_at:
+                self._counts = {(category, difficulty): count
+                                for category, difficulty, count
+                                in self._loader()}
+                self._expires_at = time.monotonic() + self.ttl
+            return dict(self._counts)
+
+    def add(self, category, difficulty, count=1):
+        with self._lock:
+            if self._counts is not None:
+                key = (category, difficulty)
+                self._counts[key] = self._counts.get(key, 0) + count
+
+    def remove(self, category, difficulty):
+        with self._lock:
+            if self._counts is None:
+                return
+            key = (category, difficulty)
+            remaining = self._counts.get(key, 0) - 1
+            if remaining > 0:
+                self._counts[key] = remaining
+            else:
+                self._counts.pop(key, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+'''
+In-memory index of question ids by (category, difficulty), used by the
+adaptive quiz mode to find a question near a target difficulty without
+touching the questions table.
+'''
+
+PICK_ATTEMPTS = 8
+
+
+class DifficultyIndex(object):
+    '''
+    (category, difficulty) -> sorted array of question ids.
+    Buckets are compact machine-word arrays rather than lists of
+    objects. They are built from the (id, category, difficulty) rows
+    returned by loader() on first use and kept up to date by add() and
+    remove() as questions are inserted and deleted. Like
+    QuestionStatsCache the index is rebuilt once it is older than ttl
+    seconds, to pick up writes made by other processes.
+    '''
+
+    def __init__(self, loader, ttl=300):
+        self.ttl = ttl
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._buckets = None
+        self._loaded_at = 0
+
+    def _current(self):
+        # called with the lock held
+        if self._buckets is None or \
+                time.monotonic() - self._loaded_at >= self.ttl:
+            buckets = {}
+            for question_id, category, difficulty in self._loader():
+                if difficulty is None:
+                    continue
+                buckets.setdefault((category, difficulty),
+                                   array('l')).append(question_id)
+            for bucket in buckets.values():
+                bucket[:] = array('l', sorted(bucket))
+            self._buckets = buckets
+            self._loaded_at = time.monotonic()
+        return self._buckets
+
+    def invalidate(self):
+        with self._lock:
+            self._buckets = None
+
+    def add(self, question_id, category, difficulty):
+        if difficulty is None:
+            return
+        with self._lock:
+            # not loaded yet: the loader will pick the question up
+            if self._buckets is None:
+                return
+            bucket = self._buckets.setdefault((category, difficulty),
+                                              array('l'))
+            position = bisect_left(bucket, question_id)
+            if position == len(bucket) or bucket[position] != question_id:
+                bucket.insert(position, question_id)
+
+    def remove(self, question_id, category, difficulty):
+        with self._lock:
+            if self._buckets is None:
+                return
+            bucket = self._buckets.get((category, difficulty))
+            if bucket is None:
+                return
+            position = bisect_left(bucket, question_id)
+            if position < len(bucket) and bucket[position] == question_id:
+                del bucket[position]
+                if not bucket:
+                    del self._buckets[(category, difficulty)]
+
+    def count(self, category=None):
+        with self._lock:
+            return sum(len(bucket)
+                       for (bucket_category, _), bucket
+                       in self._current().items()
+                       if category is None or bucket_category == category)
+
+    def pick(self, category, target, exclude=(), rng=random):
+        '''
+        Returns a random question id of the category (any category when
+        category is None) whose difficulty is closest to target, skipping
+        ids in exclude. Returns None when every question is excluded.
+        '''
+        with self._lock:
+            by_difficulty = {}
+            for (bucket_category, difficulty), bucket in \
+                    self._current().items():
+                if category is None or bucket_category == category:
+                    by_difficulty.setdefault(difficulty, []).append(bucket)
+            for difficulty in sorted(by_difficulty,
+                                     key=lambda d: (abs(d - target), d)):
+                question_id = self._pick_from(by_difficulty[difficulty],
+                                              exclude, rng)
+                if question_id is not None:
+                    return question_id
+        return None
+
+    def _pick_from(self, buckets, exclude, rng):
+        total = sum(len(bucket) for bucket in buckets)
+        for _ in range(PICK_ATTEMPTS):
+            position = rng.randrange(total)
+            for bucket in buckets:
+                if position < len(bucket):
+                    question_id = bucket[position]
+                    break
+                position -= len(bucket)
+            if question_id not in exclude:
+                return question_id
+        candidates = [question_id for bucket in buckets
+                      for question_id in bucket
+                      if question_id not in exclude]
+        return rng.choice(candidates) if candidates else None
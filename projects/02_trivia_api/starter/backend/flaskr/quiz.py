@@ -0,0 +1,70 @@
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+'''
+Server-side quiz sessions.
+A session is a pre-shuffled permutation of question ids kept under
+a random token, so every draw is a pop from the end of a list
+instead of a scan over the category.
+'''
+
+QUIZ_SESSION_TTL = 30 * 60
+QUIZ_SESSION_LIMIT = 10000
+
+
+class QuizSessionStore(object):
+    '''
+    Token -> shuffled deck of question ids.
+    Sessions are kept in least-recently-used order, so expired ones
+    are always at the front and eviction never scans live sessions.
+    '''
+
+    def __init__(self, ttl=QUIZ_SESSION_TTL, limit=QUIZ_SESSION_LIMIT):
+        self.ttl = ttl
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def create(self, question_ids):
+        deck = list(question_ids)
+        random.shuffle(deck)
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._evict(time.monotonic(), reserve=1)
+            self._sessions[token] = [time.monotonic() + self.ttl, deck]
+        return token
+
+    def draw(self, token):
+        '''
+        Pops the next question id of the session.
+        Returns None when the deck is exhausted and raises KeyError
+        for unknown or expired tokens.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions[token]
+            self._sessions.move_to_end(token)
+            session[0] = now + self.ttl
+            deck = session[1]
+            if not deck:
+                return None
+            return deck.pop()
+
+    def discard(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self, now, reserve=0):
+        sessions = self._sessions
+        while sessions:
+            expires_at = next(iter(sessions.values()))[0]
+            if expires_at > now and len(sessions) + reserve <= self.limit:
+                break
+            sessions.popitem(last=False)
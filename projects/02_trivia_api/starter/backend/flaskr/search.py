@@ -0,0 +1,180 @@
+import re
+
+import threading
+
+from sqlalchemy import (column, func, literal_column, or_, select, table,
+                        text)
+
+from models import Question
+from .serialize import QUESTION_COLUMNS
+
+'''
+Search engines behind POST /questions/search.
+Every engine matches the search term against both the question and
+the answer text and returns one ranked page of result rows (see
+serialize.QUESTION_COLUMNS) together with the total number of matches.
+
+    PostgreSQL: a generated tsvector column with a GIN index.
+    SQLite:     an FTS5 table kept in sync by triggers.
+    anything else (or no index): ILIKE scan.
+
+The indexes are created by the question search index migration
+(flask db upgrade); the app only queries them.
+
+Terms are tokenized into words and every word is matched as a prefix,
+so partial input typed into the search box still finds questions.
+'''
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(search_term):
+    return TOKEN_PATTERN.findall(search_term.lower())
+
+
+class LikeSearchEngine(object):
+    '''
+    Sequential ILIKE scan, used when no full-text index is available.
+    '''
+
+    name = 'like'
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, search_term, page, per_page):
+        pattern = '%{}%'.format(search_term)
+        query = self.db.session.query(
+            *QUESTION_COLUMNS, func.count().over()).filter(
+            or_(Question.question.ilike(pattern),
+                Question.answer.ilike(pattern))).order_by(Question.id)
+        return self._page(query, page, per_page)
+
+    def _page(self, query, page, per_page):
+        rows = query.limit(per_page).offset((page - 1) * per_page).all()
+        total = rows[0][-1] if rows else 0
+        return [row[:-1] for row in rows], total
+
+    def _all(self, page, per_page):
+        query = self.db.session.query(
+            *QUESTION_COLUMNS, func.count().over()).order_by(Question.id)
+        return self._page(query, page, per_page)
+
+
+class PostgresSearchEngine(LikeSearchEngine):
+    '''
+    Full-text search on a generated tsvector column with a GIN index.
+    The 'simple' configuration is used so that short words such as
+    "which" are not dropped as stop words.
+    '''
+
+    name = 'postgresql'
+
+    search_vector = literal_column('questions.search_vector')
+
+    def search(self, search_term, page, per_page):
+        tokens = tokenize(search_term)
+        if not tokens:
+            return self._all(page, per_page)
+        ts_query = func.to_tsquery(
+            'simple', ' & '.join(token + ':*' for token in tokens))
+        query = self.db.session.query(
+            *QUESTION_COLUMNS, func.count().over()).filter(
+            self.search_vector.op('@@')(ts_query)).order_by(
+            func.ts_rank_cd(self.search_vector, ts_query).desc(),
+            Question.id)
+        return self._page(query, page, per_page)
+
+
+class SqliteSearchEngine(LikeSearchEngine):
+    '''
+    Full-text search on an external-content FTS5 table ranked by bm25.
+    '''
+
+    name = 'sqlite-fts5'
+
+    fts = table('questions_fts', column('rowid'))
+
+    def search(self, search_term, page, per_page):
+        tokens = tokenize(search_term)
+        if not tokens:
+            return self._all(page, per_page)
+        match = ' '.join('"{}"*'.format(token) for token in tokens)
+        matches = select([
+            self.fts.c.rowid,
+            literal_column('bm25(questions_fts)').label('rank')]).where(
+            text('questions_fts MATCH :match')).alias('matches')
+        query = self.db.session.query(
+            *QUESTION_COLUMNS, func.count().over()).join(
+            matches, matches.c.rowid == Question.id).order_by(
+            matches.c.rank, Question.id).params(match=match)
+        return self._page(query, page, per_page)
+
+
+def search_index(db):
+    '''
+    Name of the engine whose index the migrations created in the bound
+    database, or None.
+    '''
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        found = db.session.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'questions' "
+            "AND column_name = 'search_vector'")).first()
+        if found is not None:
+            return PostgresSearchEngine.name
+    elif dialect == 'sqlite':
+        found = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'questions_fts'")).first()
+        if found is not None:
+            return SqliteSearchEngine.name
+    return None
+
+
+ENGINES = {
+    PostgresSearchEngine.name: PostgresSearchEngine,
+    SqliteSearchEngine.name: SqliteSearchEngine,
+}
+
+
+'''
+create_search_engine(db)
+    picks the engine for the search index found in the bound database
+'''
+
+
+def create_search_engine(db):
+    return ENGINES.get(search_index(db), LikeSearchEngine)(db)
+
+
+class LazySearchEngine(object):
+    '''
+    Picks the engine on the first search rather than at startup, so an
+    app created before flask db upgrade ran (or a test database
+    migrated after create_app) uses the index once it exists.
+    reset() makes the next search look again.
+    '''
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._engine = None
+
+    @property
+    def engine(self):
+        engine = self._engine
+        if engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = create_search_engine(self.db)
+                engine = self._engine
+        return engine
+
+    def search(self, search_term, page, per_page):
+        return self.engine.search(search_term, page, per_page)
+
+    def reset(self):
+        with self._lock:
+            self._engine = None
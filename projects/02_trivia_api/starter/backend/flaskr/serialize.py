@@ -0,0 +1,108 @@
+import json
+
+from flask import Response
+
+from models import Question
+
+'''
+Fast read path for question listings.
+Listings select only the columns they return and turn the row tuples
+straight into dicts, skipping ORM identity-map hydration and the
+per-row Question.format() call. Responses are encoded with the
+fastest JSON library available (see select_json_encoder).
+'''
+
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+
+STREAM_BATCH_SIZE = 1000
+
+
+def question_rows(db):
+    return db.session.query(*QUESTION_COLUMNS)
+
+
+def format_rows(rows):
+    return [dict(zip(QUESTION_FIELDS, row)) for row in rows]
+
+
+'''
+Every encoder produces the same bytes for the same payload: compact,
+keys sorted like jsonify sorts them, and non-ASCII text as UTF-8 rather
+than \\u escapes (orjson cannot escape it). Payload keys must be
+strings, so that all of them sort keys the same way.
+'''
+
+
+def _stdlib_dumps(payload):
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True,
+                      ensure_ascii=False).encode('utf-8')
+
+
+def _orjson_encoder():
+    import orjson
+    option = orjson.OPT_SORT_KEYS
+
+    def dumps(payload):
+        return orjson.dumps(payload, option=option)
+    return dumps
+
+
+def _ujson_encoder():
+    import ujson
+
+    def dumps(payload):
+        return ujson.dumps(payload, ensure_ascii=False, sort_keys=True,
+                           escape_forward_slashes=False).encode('utf-8')
+    return dumps
+
+
+JSON_ENCODERS = {
+    'orjson': _orjson_encoder,
+    'ujson': _ujson_encoder,
+    'json': lambda: _stdlib_dumps,
+}
+
+
+'''
+select_json_encoder(name)
+    returns a dumps(payload) -> bytes callable. With a name from
+    JSON_ENCODERS that library is used (ImportError if missing);
+    without one, orjson and ujson are tried before the stdlib.
+'''
+
+
+def select_json_encoder(name=None):
+    if name is not None:
+        return JSON_ENCODERS[name]()
+    for candidate in ('orjson', 'ujson'):
+        try:
+            return JSON_ENCODERS[candidate]()
+        except ImportError:
+            pass
+    return _stdlib_dumps
+
+
+def json_response(dumps, payload, status=200):
+    return Response(dumps(payload), status=status,
+                    mimetype='application/json')
+
+
+'''
+stream_questions(dumps, head, first_row, rows)
+    streams {head..., "questions": [...], "total_questions": n}
+    without building the list in memory. first_row has already been
+    fetched by the caller (to answer 404 before streaming starts) and
+    rows is the iterator over the remaining rows.
+'''
+
+
+def stream_questions(dumps, head, first_row, rows):
+    yield dumps(head)[:-1] + b',"questions":['
+    yield dumps(dict(zip(QUESTION_FIELDS, first_row)))
+    total = 1
+    for row in rows:
+        yield b',' + dumps(dict(zip(QUESTION_FIELDS, row)))
+        total += 1
+    yield b'],"total_questions":' + str(total).encode('ascii') + b'}'
@@ -0,0 +1,79 @@
+"""questions.category as indexed integer foreign key
+
+Revision ID: 9d2e4b7a6c10
+Revises: 5c3f1a9e2b71
+Create Date: 2026-10-18 09:30:00.000000
+
+Converts questions.category from a string to an integer foreign key
+to categories.id and adds a (category, id) index. The new values are
+backfilled in id ranges of BATCH_SIZE rows so no single UPDATE has to
+rewrite the whole table. Strings that do not name an existing category
+become NULL. Databases restored from trivia.psql already have an
+integer column; for them only the missing constraint and index are
+added.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2e4b7a6c10'
+down_revision = '5c3f1a9e2b71'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+FOREIGN_KEY = 'fk_questions_category_categories'
+INDEX = 'ix_questions_category_id'
+
+
+def backfill(statement):
+    bind = op.get_bind()
+    low, high = bind.execute(
+        sa.text('SELECT min(id), max(id) FROM questions')).first()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        bind.execute(sa.text(statement),
+                     {'start': start, 'stop': start + BATCH_SIZE})
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name']: column
+               for column in inspector.get_columns('questions')}
+
+    if not isinstance(columns['category']['type'], sa.Integer):
+        op.add_column('questions',
+                      sa.Column('category_id', sa.Integer(), nullable=True))
+        backfill(
+            'UPDATE questions SET category_id = ('
+            'SELECT categories.id FROM categories '
+            'WHERE CAST(categories.id AS VARCHAR) = questions.category) '
+            'WHERE id >= :start AND id < :stop')
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.drop_column('category')
+            batch_op.alter_column('category_id', new_column_name='category')
+
+    foreign_keys = sa.inspect(op.get_bind()).get_foreign_keys('questions')
+    if not any(foreign_key['constrained_columns'] == ['category']
+               for foreign_key in foreign_keys):
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.create_foreign_key(
+                FOREIGN_KEY, 'categories', ['category'], ['id'])
+
+    indexes = sa.inspect(op.get_bind()).get_indexes('questions')
+    if not any(index['name'] == INDEX for index in indexes):
+        op.create_index(INDEX, 'questions', ['category', 'id'])
+
+
+def downgrade():
+    op.drop_index(INDEX, table_name='questions')
+    op.add_column('questions',
+                  sa.Column('category_name', sa.String(), nullable=True))
+    backfill(
+        'UPDATE questions SET category_name = CAST(category AS VARCHAR) '
+        'WHERE id >= :start AND id < :stop')
+    with op.batch_alter_table('questions') as batch_op:
+        batch_op.drop_column('category')
+        batch_op.alter_column('category_name', new_column_name='category')
@@ -0,0 +1,82 @@
+"""full-text search index on questions
+
+Revision ID: e4a1c7b9d2f3
+Revises: 9d2e4b7a6c10
+Create Date: 2026-10-18 10:00:00.000000
+
+Index behind POST /questions/search (see flaskr/search.py):
+
+    PostgreSQL: a generated tsvector column over question and answer
+                with a GIN index.
+    SQLite:     an external-content FTS5 table kept in sync by
+                triggers, when SQLite is built with FTS5.
+
+Other databases get no index and are searched with ILIKE.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a1c7b9d2f3'
+down_revision = '9d2e4b7a6c10'
+branch_labels = None
+depends_on = None
+
+FTS_TRIGGERS = ('questions_fts_insert', 'questions_fts_delete',
+                'questions_fts_update')
+
+
+def sqlite_has_fts5(bind):
+    return bind.execute(sa.text(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar() == 1
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE questions "
+            "ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', "
+            "coalesce(question, '') || ' ' || coalesce(answer, ''))) "
+            "STORED")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_questions_search_vector "
+            "ON questions USING GIN (search_vector)")
+    elif bind.dialect.name == 'sqlite' and sqlite_has_fts5(bind):
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts "
+            "USING fts5(question, answer, "
+            "content='questions', content_rowid='id')")
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS questions_fts_insert "
+            "AFTER INSERT ON questions BEGIN "
+            "INSERT INTO questions_fts(rowid, question, answer) "
+            "VALUES (new.id, new.question, new.answer); END")
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS questions_fts_delete "
+            "AFTER DELETE ON questions BEGIN "
+            "INSERT INTO questions_fts(questions_fts, rowid, question, "
+            "answer) VALUES ('delete', old.id, old.question, old.answer); "
+            "END")
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS questions_fts_update "
+            "AFTER UPDATE ON questions BEGIN "
+            "INSERT INTO questions_fts(questions_fts, rowid, question, "
+            "answer) VALUES ('delete', old.id, old.question, old.answer); "
+            "INSERT INTO questions_fts(rowid, question, answer) "
+            "VALUES (new.id, new.question, new.answer); END")
+        op.execute(
+            "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_questions_search_vector")
+        op.execute("ALTER TABLE questions DROP COLUMN IF EXISTS search_vector")
+    elif bind.dialect.name == 'sqlite':
+        for trigger in FTS_TRIGGERS:
+            op.execute("DROP TRIGGER IF EXISTS {}".format(trigger))
+        op.execute("DROP TABLE IF EXISTS questions_fts")
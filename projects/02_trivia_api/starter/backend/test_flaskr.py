@@ -1,34 +1,114 @@
 import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+from unittest import mock
+from flask_migrate import upgrade
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session
 
+import flaskr
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.search import search_index
+from flaskr.serialize import JSON_ENCODERS
+from models import db, Question, Category
+
+"""
+Test harness.
+By default every test process gets its own in-memory SQLite database,
+migrated with the Alembic revisions and seeded once from
+fixtures/trivia.json, so the suite needs no PostgreSQL and can run in
+several worker processes at once (e.g. pytest -n 4).
+Set TRIVIA_TEST_DATABASE_URL to run against another database instead;
+it is migrated the same way and, when empty, seeded from the fixtures.
+Each test runs inside a transaction that is rolled back afterwards;
+commits made by the app only release a SAVEPOINT inside it.
+"""
+TEST_DATABASE_URL = os.environ.get('TRIVIA_TEST_DATABASE_URL', 'sqlite://')
+FIXTURES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'trivia.json')
+MIGRATIONS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_test_app = None
+
+
+def get_test_app():
+    """Create the app, migrate and seed its database once per process."""
+    global _test_app
+    if _test_app is not None:
+        return _test_app
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URL}
+    if TEST_DATABASE_URL.startswith('sqlite'):
+        # let SQLAlchemy, not pysqlite, issue BEGIN so SAVEPOINTs work
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'isolation_level': None}}
+    app = create_app(config)
+    with app.app_context():
+        if TEST_DATABASE_URL.startswith('sqlite'):
+            event.listen(db.engine, 'begin',
+                         lambda connection: connection.execute('BEGIN'))
+        upgrade(directory=MIGRATIONS_PATH)
+        if Category.query.count() == 0:
+            with open(FIXTURES_PATH) as fixtures:
+                data = json.load(fixtures)
+            db.session.execute(Category.__table__.insert(),
+                               data['categories'])
+            db.session.execute(Question.__table__.insert(),
+                               data['questions'])
+            db.session.commit()
+        app.reset_caches()
+        db.session.remove()
+    _test_app = app
+    return app
+
+
+class TransactionalSession(scoped_session):
+    """Scoped session that outlives the requests of a single test."""
+
+    def remove(self):
+        pass
+
+    def close_test_session(self):
+        self.rollback()
+        super(TransactionalSession, self).remove()
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
+        """Define test variables and open the test transaction."""
+        self.app = get_test_app()
         self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = 'postgres://{}:{}@{}/{}'.format(
-            'postgres', 'admin', 'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.original_session = db.session
+        db.session = TransactionalSession(
+            db.create_session({'bind': self.connection, 'binds': {}}))
+        db.session.begin_nested()
+        event.listen(db.session(), 'after_transaction_end',
+                     self.restart_savepoint)
+
+    def restart_savepoint(self, session, transaction):
+        """Open a new SAVEPOINT whenever the app commits or rolls back."""
+        if transaction.nested and not transaction._parent.nested:
+            session.expire_all()
+            session.begin_nested()
 
     def tearDown(self):
-        """Executed after reach test"""
-        pass
+        """Roll back everything the test wrote."""
+        event.remove(db.session(), 'after_transaction_end',
+                     self.restart_savepoint)
+        db.session.close_test_session()
+        self.transaction.rollback()
+        self.connection.close()
+        db.session = self.original_session
+        self.app.reset_caches()
+        db.session.remove()
+        self.app_context.pop()
 
     """
     TODO
@@ -59,6 +139,40 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(data.get('categories'))
         self.assertIsNone(data.get('current_category'))
 
+    def test_get_questions_with_after_id_cursor(self):
+        res = self.client().get('/questions')
+        first_page = json.loads(res.data)
+
+        res = self.client().get(
+            '/questions?after_id=' + str(first_page['next_after_id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertTrue(all(question['id'] > first_page['next_after_id']
+                            for question in data['questions']))
+        self.assertEqual(data['total_questions'],
+                         first_page['total_questions'])
+
+    def test_total_questions_updates_after_post_question(self):
+        res = self.client().get('/questions')
+        before = json.loads(res.data)['total_questions']
+
+        res = self.client().post(
+            '/questions',
+            json={
+                'question': "Which city is capital of US",
+                'answer': "Washington DC",
+                'category': 3,
+                'difficulty': 1})
+        created = json.loads(res.data)['created']
+
+        res = self.client().get('/questions')
+        after = json.loads(res.data)['total_questions']
+        self.client().delete('/questions/' + str(created))
+
+        self.assertEqual(after, before + 1)
+
     def test_get_categories(self):
         res = self.client().get('/categories')
         data = json.loads(res.data)
@@ -68,6 +182,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNotNone(data.get('total_categories'))
         self.assertIsNotNone(data.get('categories'))
 
+    def test_304_for_unchanged_categories(self):
+        res = self.client().get('/categories')
+        etag = res.headers.get('ETag')
+
+        res = self.client().get('/categories',
+                                headers={'If-None-Match': etag})
+
+        self.assertIsNotNone(etag)
+        self.assertEqual(res.status_code, 304)
+
     def test_404_for_malformed_path_for_get_categories(self):
         res = self.client().get('/categories/23')
         data = json.loads(res.data)
@@ -78,6 +202,55 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNone(data.get('categories'))
         self.assertEqual(data['message'], "resource not found")
 
+    def test_get_stats(self):
+        res = self.client().get('/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertEqual(sum(data['categories'].values()),
+                         data['total_questions'])
+        self.assertEqual(sum(data['difficulties'].values()),
+                         data['total_questions'])
+
+    def test_stats_updates_after_post_question(self):
+        res = self.client().get('/stats')
+        before = json.loads(res.data)
+
+        res = self.client().post(
+            '/questions',
+            json={
+                'question': "Which city is capital of US",
+                'answer': "Washington DC",
+                'category': 3,
+                'difficulty': 1})
+        created = json.loads(res.data)['created']
+
+        res = self.client().get('/stats')
+        after = json.loads(res.data)
+        self.client().delete('/questions/' + str(created))
+
+        self.assertEqual(after['total_questions'],
+                         before['total_questions'] + 1)
+        self.assertEqual(after['categories']['3'],
+                         before['categories']['3'] + 1)
+
+    def test_json_encoders_produce_the_same_bytes(self):
+        res = self.client().get('/stats')
+        payload = json.loads(res.data)
+        payload['questions'] = [{'question': "Où est / le café?",
+                                 'answer': '"</script>" \u00e9\U0001F600'}]
+
+        encoded = set()
+        for name, encoder in JSON_ENCODERS.items():
+            try:
+                dumps = encoder()
+            except ImportError:
+                continue
+            encoded.add(dumps(payload))
+
+        self.assertEqual(len(encoded), 1)
+
     def test_delete_question(self):
         res = self.client().post(
             '/questions',
@@ -133,6 +306,81 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], 'False')
         self.assertIsNone(data.get('created'))
 
+    def test_post_question_batch(self):
+        res = self.client().get('/questions')
+        before = json.loads(res.data)['total_questions']
+
+        res = self.client().post(
+            '/questions/batch',
+            json={'questions': [{
+                'question': "Which city is capital of US",
+                'answer': "Washington DC",
+                'category': 3,
+                'difficulty': 1}, {
+                'question': "Which city is capital of France",
+                'answer': "Paris",
+                'category': 3,
+                'difficulty': 1}]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertEqual(data['total_created'], 2)
+        res = self.client().get('/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], before + 2)
+
+    def test_post_question_batch_indexes_only_its_own_ids(self):
+        index = self.app.difficulty_index
+        before = index.count(2)
+        insert = flaskr.insert_rows_returning_ids
+
+        def insert_after_another_writer(rows):
+            # another worker inserts a question right before this batch
+            db.session.add(Question(question="Who painted Guernica?",
+                                    answer="Picasso", category=2,
+                                    difficulty=5))
+            db.session.flush()
+            return insert(rows)
+
+        with mock.patch('flaskr.insert_rows_returning_ids',
+                        insert_after_another_writer):
+            res = self.client().post(
+                '/questions/batch',
+                json={'questions': [{
+                    'question': "Who painted The Starry Night?",
+                    'answer': "Van Gogh",
+                    'category': 2,
+                    'difficulty': 5}]})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(index.count(2), before + 1)
+        question = Question.query.filter(
+            Question.answer == "Van Gogh").one()
+        self.assertEqual(index.pick(2, 5, exclude=set(range(question.id))),
+                         question.id)
+
+    def test_422_invalid_category_for_post_question_batch(self):
+        res = self.client().get('/questions')
+        before = json.loads(res.data)['total_questions']
+
+        res = self.client().post(
+            '/questions/batch',
+            json={'questions': [{
+                'question': "Which city is capital of US",
+                'answer': "Washington DC",
+                'category': 3,
+                'difficulty': 1}, {
+                'question': "Which city is capital of France",
+                'answer': "Paris",
+                'category': 1000,
+                'difficulty': 1}]})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], 'False')
+        res = self.client().get('/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], before)
+
     def test_get_question_based_on_category(self):
         res = self.client().get('/categories/2/questions')
         data = json.loads(res.data)
@@ -143,6 +391,15 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNotNone(data.get('total_questions'))
         self.assertEqual(data.get('current_category'), 'Art')
 
+    def test_stream_question_based_on_category(self):
+        res = self.client().get('/categories/2/questions?stream=true')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertEqual(data['total_questions'], len(data['questions']))
+        self.assertEqual(data.get('current_category'), 'Art')
+
     def test_404_if_category_not_valid_for_get_question_based_on_category(
             self):
         res = self.client().get('/categories/10/questions')
@@ -167,6 +424,58 @@ class TriviaTestCase(unittest.TestCase):
         self.assertIsNotNone(data.get('total_questions'))
         self.assertIsNone(data.get('current_category'))
 
+    def test_search_question_matches_answer_text(self):
+        res = self.client().post(
+            '/questions/search',
+            json={
+                'searchTerm': "scarab"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertIn('Scarab',
+                      [question['answer'] for question in data['questions']])
+
+    def test_search_question_is_paginated(self):
+        res = self.client().post(
+            '/questions/search',
+            json={
+                'searchTerm': "",
+                'page': 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertGreater(data['total_questions'], 10)
+
+    def test_search_uses_the_index_created_by_the_migrations(self):
+        self.assertIsNotNone(search_index(db))
+        res = self.client().post('/questions', json={
+            'question': 'Which island is known as the Spice Island?',
+            'answer': 'Zanzibar', 'category': 3, 'difficulty': 2})
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'zanzi'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [question['answer'] for question in data['questions']],
+            ['Zanzibar'])
+
+    def test_400_for_invalid_page_for_search_question(self):
+        for page in (True, False, 0, '2', 1.5):
+            res = self.client().post(
+                '/questions/search',
+                json={
+                    'searchTerm': "title",
+                    'page': page})
+
+            self.assertEqual(res.status_code, 400, page)
+            self.assertEqual(json.loads(res.data)['success'], 'False')
+
     def test_404_if_search_is_absent_for_search_question_based_on_string(self):
         res = self.client().post(
             '/questions/search',
@@ -194,6 +503,50 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], 'True')
         self.assertIsNotNone(data.get('question'))
 
+    def test_adaptive_quiz_serves_target_difficulty(self):
+        res = self.client().post(
+            '/quizzes',
+            json={
+                'previous_questions': [],
+                'target_difficulty': 4,
+                'quiz_category': {
+                    'type': 'Art',
+                    'id': '2'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertEqual(data['question']['difficulty'], 4)
+
+    def test_difficulty_index_rebuilds_after_ttl(self):
+        index = self.app.difficulty_index
+        before = index.count(2)
+        # written behind the app's back, like another worker would
+        db.session.add(Question(question="Who painted Guernica?",
+                                answer="Picasso", category=2, difficulty=5))
+        db.session.commit()
+
+        self.assertEqual(index.count(2), before)
+        ttl, index.ttl = index.ttl, 0
+        try:
+            self.assertEqual(index.count(2), before + 1)
+        finally:
+            index.ttl = ttl
+
+    def test_422_invalid_target_difficulty_for_quiz(self):
+        res = self.client().post(
+            '/quizzes',
+            json={
+                'previous_questions': [],
+                'target_difficulty': 'hard',
+                'quiz_category': {
+                    'type': 'Art',
+                    'id': '2'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], 'False')
+
     def test_404_if_category_is_invalid_for_quiz(self):
         res = self.client().post(
             '/quizzes',
@@ -208,6 +561,42 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], 'False')
         self.assertIsNone(data.get('question'))
 
+    def test_quiz_session_draws_each_question_once(self):
+        res = self.client().post(
+            '/quizzes',
+            json={
+                'quiz_session': True,
+                'quiz_category': {
+                    'type': 'Geography',
+                    'id': '3'}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], 'True')
+        self.assertIsNotNone(data.get('quiz_session'))
+
+        seen = [data['question']['id']]
+        while True:
+            res = self.client().post(
+                '/quizzes',
+                json={'quiz_session': data['quiz_session']})
+            drawn = json.loads(res.data)
+            if drawn['question'] is False:
+                break
+            seen.append(drawn['question']['id'])
+
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_404_if_quiz_session_is_unknown(self):
+        res = self.client().post(
+            '/quizzes',
+            json={'quiz_session': 'not-a-session'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], 'False')
+        self.assertIsNone(data.get('question'))
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":